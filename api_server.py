@@ -3,6 +3,7 @@ from pydantic import BaseModel, Field
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from config import DB_CONFIG
+from catalog import search_clause, spec_clause, parse_spec_filters
 from typing import List, Optional
 from datetime import datetime
 
@@ -58,12 +59,21 @@ def get_db():
 @app.get("/api/v1/catalog/export", tags=["Public Data"])
 def get_active_listings(
         min_price: Optional[float] = Query(None),
-        brand: Optional[str] = Query(None)
+        brand: Optional[str] = Query(None),
+        search: Optional[str] = Query(None, description="Повнотекстовий пошук (марка, модель, опис)"),
+        spec: Optional[List[str]] = Query(None, description="Фільтр характеристик: назва=значення (можна кілька)")
 ):
     """
     **Експорт каталогу.**
     Використовується партнерами (Auto.ria, OLX) для отримання списку наших активних авто.
+    З параметром `search` результати сортуються за релевантністю.
+    Параметр `spec` фільтрує за характеристиками, напр. `?spec=Паливо=Дизель&spec=Коробка=Автомат`.
     """
+    try:
+        specs = parse_spec_filters(spec)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
     conn = get_db()
     cur = conn.cursor()
     try:
@@ -82,8 +92,20 @@ def get_active_listings(
         if brand:
             query += " AND b.name ILIKE %s"
             params.append(f"%{brand}%")
-
-        query += " ORDER BY sa.creation_date DESC"
+        if specs:
+            condition, cond_params = spec_clause(specs)
+            query += f" AND {condition}"
+            params.extend(cond_params)
+
+        order_params = []
+        if search:
+            condition, cond_params, rank, order_params = search_clause(search)
+            query += f" AND {condition}"
+            params.extend(cond_params)
+            query += f" ORDER BY {rank} DESC, sa.creation_date DESC"
+        else:
+            query += " ORDER BY sa.creation_date DESC"
+        params.extend(order_params)
 
         cur.execute(query, tuple(params))
         return {"timestamp": datetime.now(), "data": cur.fetchall()}
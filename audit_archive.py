@@ -0,0 +1,279 @@
+# audit_archive.py
+# Архів протоколу: закриті місяці Audit_Logs -> стиснуті Parquet-файли на диску, читання через DuckDB.
+# Запуск архівації вручну/з cron: python audit_archive.py
+import datetime
+import glob
+import os
+import uuid
+import psycopg2
+import pandas as pd
+from config import DB_ROLES
+
+# Опціональні залежності: без них архівація/читання архіву недоступні, решта сторінки працює
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# --- КОНСТАНТИ ---
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive", "audit_logs")
+HOT_MONTHS = 3            # скільки закритих місяців лишаємо в БД (плюс поточний)
+ARCHIVE_BATCH = 10000
+ARCHIVE_LOCK_KEY = 0x41524348  # ключ pg advisory lock: архівація виконується лише одним процесом одночасно
+
+ARCHIVE_COLUMNS = ["log_id", "timestamp", "user_id", "user_email", "role",
+                   "action_type", "table_name", "record_id", "details"]
+
+
+def _schema():
+    # email і роль зберігаємо як були на момент архівації: користувача згодом можуть видалити
+    return pa.schema([
+        ("log_id", pa.int64()), ("timestamp", pa.timestamp("us")), ("user_id", pa.int64()),
+        ("user_email", pa.string()), ("role", pa.string()), ("action_type", pa.string()),
+        ("table_name", pa.string()), ("record_id", pa.int64()), ("details", pa.string()),
+    ])
+
+
+def month_start(day):
+    return datetime.date(day.year, day.month, 1)
+
+
+def next_month(day):
+    return datetime.date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def archived_months():
+    """Відсортований список місяців (date першого числа), що вже лежать в архіві."""
+    months = set()
+    for path in glob.glob(os.path.join(ARCHIVE_DIR, "month=*")):
+        if not glob.glob(os.path.join(path, "*.parquet")):
+            continue  # порожня тека (архівація місяця не дописала жодного файлу) - не архів
+        months.add(datetime.datetime.strptime(os.path.basename(path)[6:], "%Y-%m").date())
+    return sorted(months)
+
+
+def can_read_archive():
+    """Чи встановлено рушій для читання архіву (duckdb)."""
+    return duckdb is not None
+
+
+def archive_month(month):
+    """
+    Переносить один місяць з Audit_Logs у Parquet (zstd) і видаляє ці рядки з БД.
+    Читання і DELETE - в одній транзакції REPEATABLE READ: видаляються рівно ті рядки, що потрапили у файл.
+    Викликати лише під блокуванням архівації (див. archive_closed_months).
+    Повертає кількість заархівованих рядків.
+    """
+    if pa is None:
+        raise RuntimeError("Для архівації потрібен пакет pyarrow.")
+
+    start, end = month_start(month), next_month(month)
+    month_dir = os.path.join(ARCHIVE_DIR, f"month={start:%Y-%m}")
+    # Окремий part-файл на кожен запуск: пізні записи в уже заархівований місяць не перезаписують старі
+    path = os.path.join(month_dir, f"part-{uuid.uuid4().hex}.parquet")
+    tmp = path + ".tmp"
+
+    conn = psycopg2.connect(**DB_ROLES['default'])
+    conn.set_session(isolation_level='REPEATABLE READ')
+    rows, committed = 0, False
+    try:
+        with conn.cursor(name="audit_archive") as cur:
+            cur.itersize = ARCHIVE_BATCH
+            cur.execute("""
+                SELECT al.log_id, al."timestamp", al.user_id, u.email, u.role,
+                       al.action_type, al.table_name, al.record_id, al.details
+                FROM public."Audit_Logs" al
+                LEFT JOIN public."Users" u ON al.user_id = u.user_id
+                WHERE al."timestamp" >= %s AND al."timestamp" < %s
+                ORDER BY al."timestamp", al.log_id;
+            """, (start, end))
+
+            schema, writer = _schema(), None
+            while True:
+                batch = cur.fetchmany(ARCHIVE_BATCH)
+                if not batch:
+                    break
+                if writer is None:
+                    # Теку створюємо лише коли є що писати: порожня тека виглядала б як заархівований місяць
+                    os.makedirs(month_dir, exist_ok=True)
+                    writer = pq.ParquetWriter(tmp, schema, compression="zstd")
+                columns = list(zip(*batch))
+                writer.write_table(pa.table([pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                                            schema=schema))
+                rows += len(batch)
+
+        if writer is None:
+            conn.rollback()
+            return 0
+
+        writer.close()
+
+        # Спершу DELETE, потім перейменування: до коміту файл лишається .tmp і читачі його не бачать,
+        # тож рядок ніколи не буде одночасно і в БД, і в архіві. Збій між комітом і os.replace
+        # виправляє _recover_pending при наступному запуску.
+        with conn.cursor() as cur:
+            cur.execute('DELETE FROM public."Audit_Logs" WHERE "timestamp" >= %s AND "timestamp" < %s;', (start, end))
+        conn.commit()
+        committed = True
+        os.replace(tmp, path)
+        return rows
+    except Exception:
+        if not committed:
+            conn.rollback()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        raise
+    finally:
+        conn.close()
+
+
+def _recover_pending():
+    """
+    Незавершені архівації (*.parquet.tmp після збою): якщо рядки файлу ще є в БД - DELETE не відбувся,
+    файл видаляємо; якщо їх уже немає - коміт пройшов, файл стає частиною архіву.
+    Лише під блокуванням архівації: інакше .tmp паралельного запуску прийняли б за залишок збою.
+    """
+    pending = glob.glob(os.path.join(ARCHIVE_DIR, "month=*", "*.parquet.tmp"))
+    if not pending:
+        return
+
+    conn = psycopg2.connect(**DB_ROLES['default'])
+    try:
+        with conn.cursor() as cur:
+            for tmp in pending:
+                try:
+                    first_id = pq.read_table(tmp, columns=["log_id"])["log_id"][0].as_py()
+                except Exception:
+                    os.remove(tmp)  # файл недописаний - до DELETE справа не дійшла
+                    continue
+                cur.execute('SELECT EXISTS (SELECT 1 FROM public."Audit_Logs" WHERE log_id = %s);', (first_id,))
+                if cur.fetchone()[0]:
+                    os.remove(tmp)
+                else:
+                    os.replace(tmp, tmp[:-len(".tmp")])
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+def archive_closed_months(keep_months=HOT_MONTHS, today=None):
+    """Архівує всі місяці, старші за keep_months закритих місяців. Повертає {місяць: рядків}."""
+    if pa is None:
+        raise RuntimeError("Для архівації потрібен пакет pyarrow.")
+
+    cutoff = month_start(today or datetime.date.today())
+    for _ in range(keep_months):
+        cutoff = month_start(cutoff - datetime.timedelta(days=1))
+
+    # Блокування сесії тримається до кінця архівації: cron і кнопка на сторінці не перетнуться
+    conn = psycopg2.connect(**DB_ROLES['default'])
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s);", (ARCHIVE_LOCK_KEY,))
+            if not cur.fetchone()[0]:
+                raise RuntimeError("Архівація вже виконується іншим процесом.")
+
+            _recover_pending()
+
+            cur.execute("""
+                SELECT DISTINCT date_trunc('month', "timestamp")::date
+                FROM public."Audit_Logs" WHERE "timestamp" < %s ORDER BY 1;
+            """, (cutoff,))
+            months = [row[0] for row in cur.fetchall()]
+
+            return {month: archive_month(month) for month in months}
+    finally:
+        conn.close()  # закриття сесії знімає advisory lock
+
+
+# --- ЧИТАННЯ АРХІВУ ---
+def _archive_files(start, end):
+    """Parquet-файли місяців, що перетинаються з [start, end)."""
+    files = []
+    for month in archived_months():
+        if month < end and next_month(month) > start:
+            files += glob.glob(os.path.join(ARCHIVE_DIR, f"month={month:%Y-%m}", "*.parquet"))
+    return files
+
+
+def _archive_where(filters):
+    start, end, action, user_ids = filters
+    conds = ['"timestamp" >= ?', '"timestamp" < ?']
+    params = [start, end]
+    if action is not None:
+        conds.append("action_type = ?")
+        params.append(action)
+    if user_ids is not None:
+        conds.append("list_contains(?, user_id)")
+        params.append(list(user_ids))
+    return " WHERE " + " AND ".join(conds), params
+
+
+def query_archive_page(filters, cursor=None, limit=100):
+    """Сторінка архіву з тим самим keyset (timestamp, log_id), що й у БД. None, якщо архів не зачеплено."""
+    files = _archive_files(filters[0], filters[1])
+    if duckdb is None or not files:
+        return None
+
+    where, params = _archive_where(filters)
+    if cursor is not None:
+        where += ' AND ("timestamp", log_id) < (?, ?)'
+        params += [pd.Timestamp(cursor[0]).to_pydatetime(), int(cursor[1])]
+
+    with duckdb.connect() as con:
+        return con.execute(f"""
+            SELECT {", ".join(f'"{c}"' for c in ARCHIVE_COLUMNS)}
+            FROM read_parquet(?) {where}
+            ORDER BY "timestamp" DESC, log_id DESC
+            LIMIT ?;
+        """, [files] + params + [limit]).df()
+
+
+def iter_archive_rows(filters, columns, batch_size=ARCHIVE_BATCH):
+    """
+    Генератор батчів (списків кортежів) архівних записів у порядку timestamp DESC, log_id DESC.
+    Для фонового експорту: дописується після рядків з БД (архів завжди старший).
+    """
+    files = _archive_files(filters[0], filters[1])
+    if duckdb is None or not files:
+        return
+
+    where, params = _archive_where(filters)
+    with duckdb.connect() as con:
+        con.execute(f"""
+            SELECT {", ".join(f'"{c}"' for c in columns)}
+            FROM read_parquet(?) {where}
+            ORDER BY "timestamp" DESC, log_id DESC;
+        """, [files] + params)
+        while True:
+            batch = con.fetchmany(batch_size)
+            if not batch:
+                break
+            yield batch
+
+
+def archive_action_counts(filters):
+    """Кількість архівних записів за типами дій (DataFrame action_type, cnt) або None."""
+    files = _archive_files(filters[0], filters[1])
+    if duckdb is None or not files:
+        return None
+
+    where, params = _archive_where(filters)
+    with duckdb.connect() as con:
+        return con.execute(f"""
+            SELECT action_type, COUNT(*) AS cnt
+            FROM read_parquet(?) {where}
+            GROUP BY action_type;
+        """, [files] + params).df()
+
+
+if __name__ == "__main__":
+    for archived_month, count in archive_closed_months().items():
+        print(f"{archived_month:%Y-%m}: {count} записів заархівовано")
@@ -22,16 +22,22 @@ def login_user(email, password):
     Повертає словник з даними користувача або None.
     """
     # Отримуємо користувача з бази
+    # employee_id підтягуємо одразу (для персоналу), щоб сторінки не шукали його при кожній дії.
+    # Email співробітника не унікальний у схемі - при дублікатах беремо найменший id, а не випадковий рядок
     query = """
-        SELECT user_id, first_name, last_name, password_hash, role 
-        FROM public."Users" 
-        WHERE email = %s;
+        SELECT u.user_id, u.first_name, u.last_name, u.password_hash, u.role,
+               (SELECT e.employee_id FROM public."Employees" e
+                WHERE e.email = u.email
+                ORDER BY e.employee_id
+                LIMIT 1) AS employee_id
+        FROM public."Users" u
+        WHERE u.email = %s;
     """
     user_data = run_query(query, (email,), fetch="one")
 
     if user_data:
-        # Розпаковка кортежу (id, first, last, hash, role)
-        user_id, first_name, last_name, db_hash, role = user_data
+        # Розпаковка кортежу (id, first, last, hash, role, employee_id)
+        user_id, first_name, last_name, db_hash, role, employee_id = user_data
 
         # Перевірка пароля
         # Примітка: Якщо у тебе тестові дані з Faker, там паролі не хешовані.
@@ -44,7 +50,8 @@ def login_user(email, password):
             return {
                 "id": user_id,
                 "name": f"{first_name} {last_name}",
-                "role": role
+                "role": role,
+                "employee_id": employee_id
             }
 
     return None
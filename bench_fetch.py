@@ -0,0 +1,57 @@
+# bench_fetch.py
+# Порівняння шляхів завантаження run_query: fetch="all" (кортежі -> pandas) проти COPY -> Arrow.
+# Запуск: python bench_fetch.py --rows 100000 --repeat 3
+# Потрібні pyarrow (і polars для відповідного рядка); працює з дефолтною (адмінською) роллю.
+import argparse
+import time
+from db_utils import run_query
+
+# Синтетична "широка" вибірка, схожа за типами на звіти/оголошення
+BENCH_QUERY = """
+    SELECT g AS id,
+           'brand_' || (g %% 40) AS brand,
+           'model_' || (g %% 400) AS model,
+           md5(g::text) AS vin_code,
+           2000 + g %% 25 AS year,
+           (random() * 300000)::int AS mileage,
+           (random() * 100000)::numeric(10,2) AS price,
+           (g %% 3 = 0) AS is_verified,
+           now() - g * interval '1 minute' AS created_at
+    FROM generate_series(1, %s) g;
+"""
+
+MODES = ["all", "arrow_df", "arrow", "arrow_pandas", "polars"]
+
+
+def bench(mode, rows, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run_query(BENCH_QUERY, (rows,), fetch=mode)
+        elapsed = time.perf_counter() - started
+        if result is None:
+            return None
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк fetch-режимів run_query")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'fetch':<14}{'кращий час, с':>16}{'прискорення':>14}")
+    for mode in MODES:
+        best = bench(mode, args.rows, args.repeat)
+        if best is None:
+            # run_query вже вивів причину (напр. не встановлено pyarrow/polars)
+            print(f"{mode:<14}{'помилка':>16}")
+            continue
+        baseline = baseline or best
+        print(f"{mode:<14}{best:>16.3f}{baseline / best:>13.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# car_import.py
+# Масовий імпорт авто з CSV/Excel: векторна валідація в pandas -> COPY у staging -> set-based INSERT.
+import io
+import pandas as pd
+from db_utils import get_db_connection
+
+COMPANY_EMAIL = 'company@marketplace.com'
+
+# Обов'язкові колонки файлу; всі інші колонки трактуються як характеристики (назва = Characteristics.name)
+BASE_COLUMNS = ['brand', 'model', 'vin', 'year', 'mileage', 'owner']
+
+
+def read_import_file(uploaded_file):
+    """Читає CSV або Excel у DataFrame (всі значення як рядки)."""
+    if uploaded_file.name.lower().endswith(('.xlsx', '.xls')):
+        return pd.read_excel(uploaded_file, dtype=str)
+    return pd.read_csv(uploaded_file, dtype=str)
+
+
+def validate_import(raw_df, max_year):
+    """
+    Векторна перевірка файлу.
+    Повертає (valid_df, errors_df): valid_df має нормалізовані колонки BASE_COLUMNS + характеристики,
+    errors_df - рядки файлу з колонкою 'error'.
+    """
+    df = raw_df.copy()
+    df.columns = [str(c).strip() for c in df.columns]
+    df = df.rename(columns={c: c.lower() for c in df.columns if c.lower() in BASE_COLUMNS})
+
+    missing = [c for c in BASE_COLUMNS if c not in df.columns and c != 'owner']
+    if missing:
+        raise ValueError(f"У файлі немає колонок: {', '.join(missing)}")
+
+    if 'owner' not in df.columns:
+        df['owner'] = None
+
+    df['row_no'] = range(2, len(df) + 2)  # номер рядка як у Excel (з урахуванням заголовка)
+    for col in ['brand', 'model', 'vin', 'owner']:
+        df[col] = df[col].fillna('').astype(str).str.strip()
+    df['vin'] = df['vin'].str.upper()
+    df['owner'] = df['owner'].mask(df['owner'] == '', COMPANY_EMAIL).str.lower()
+    df['year'] = pd.to_numeric(df['year'], errors='coerce')
+    df['mileage'] = pd.to_numeric(df['mileage'], errors='coerce')
+
+    checks = [
+        ((df['brand'] == '') | (df['model'] == ''), "Порожня марка або модель"),
+        (df['vin'].str.len() != 17, "VIN має бути 17 символів"),
+        (df['vin'].duplicated(keep='first'), "Дублікат VIN у файлі"),
+        (df['year'].isna() | (df['year'] < 1900) | (df['year'] > max_year), f"Рік поза межами 1900-{max_year}"),
+        (df['mileage'].isna() | (df['mileage'] < 0), "Некоректний пробіг"),
+    ]
+
+    error = pd.Series('', index=df.index)
+    for mask, message in checks:
+        error = error.mask(mask & (error == ''), message)
+
+    bad = error != ''
+    errors_df = df[bad].assign(error=error[bad])
+    valid_df = df[~bad].astype({'year': 'int64', 'mileage': 'int64'})
+    return valid_df, errors_df
+
+
+def _copy(cur, table, df):
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def import_cars(valid_df):
+    """
+    Завантажує валідовані рядки в одній транзакції.
+    Повертає список ID створених авто. Рядки з невідомим власником або VIN, що вже є в базі, пропускаються.
+    """
+    char_cols = [c for c in valid_df.columns if c not in BASE_COLUMNS + ['row_no']]
+
+    cars = valid_df[['brand', 'model', 'vin', 'year', 'mileage', 'owner']]
+    chars = (valid_df[['vin'] + char_cols]
+             .melt(id_vars='vin', var_name='name', value_name='value')
+             .dropna(subset=['value']))
+    chars['value'] = chars['value'].astype(str).str.strip()
+    chars = chars[chars['value'] != '']
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE car_import (
+                    brand text, model text, vin_code text, year int, mileage int, owner_email text
+                ) ON COMMIT DROP;
+                CREATE TEMP TABLE car_import_chars (vin_code text, name text, value text) ON COMMIT DROP;
+            """)
+            _copy(cur, "car_import", cars)
+            _copy(cur, "car_import_chars", chars)
+
+            # Довідники: всі нові марки/моделі одним запитом кожен
+            cur.execute("""
+                INSERT INTO "Brands" (name)
+                SELECT DISTINCT brand FROM car_import
+                ON CONFLICT (name) DO NOTHING;
+
+                INSERT INTO "Models" (brand_id, name)
+                SELECT DISTINCT b.brand_id, ci.model
+                FROM car_import ci
+                JOIN "Brands" b ON b.name = ci.brand
+                ON CONFLICT (brand_id, name) DO NOTHING;
+            """)
+
+            cur.execute("""
+                INSERT INTO "Cars" (model_id, owner_id, vin_code, year, mileage, verification_status)
+                SELECT m.model_id, u.user_id, ci.vin_code, ci.year, ci.mileage, 'verified'
+                FROM car_import ci
+                JOIN "Brands" b ON b.name = ci.brand
+                JOIN "Models" m ON m.brand_id = b.brand_id AND m.name = ci.model
+                JOIN "Users" u ON lower(u.email) = ci.owner_email
+                WHERE NOT EXISTS (SELECT 1 FROM "Cars" c WHERE c.vin_code = ci.vin_code)
+                RETURNING car_id;
+            """)
+            new_ids = [r[0] for r in cur.fetchall()]
+
+            cur.execute("""
+                INSERT INTO "Car_Characteristics" (car_id, characteristic_id, value)
+                SELECT c.car_id, ch.characteristic_id, v.value
+                FROM car_import_chars v
+                JOIN "Cars" c ON c.vin_code = v.vin_code
+                JOIN "Characteristics" ch ON ch.name = v.name
+                WHERE c.car_id = ANY(%s);
+            """, (new_ids,))
+        conn.commit()
+
+    return new_ids
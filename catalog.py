@@ -0,0 +1,63 @@
+# catalog.py
+# Спільні SQL-фрагменти для вітрини оголошень (Streamlit + API)
+import json
+
+# Конфіг повнотекстового пошуку (див. migrations/001_listing_search.sql)
+SEARCH_CONFIG = "simple"
+
+
+def escape_like(text):
+    """Екранує спецсимволи LIKE ('\\', '%', '_'), щоб вони шукались буквально (ESCAPE '\\')."""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def like_prefix(text):
+    """Шаблон LIKE "починається з text"."""
+    return escape_like(text) + '%'
+
+
+def search_clause(search):
+    """
+    Повертає (умова WHERE, її параметри, вираз рангу, його параметри) для пошуку по оголошеннях.
+    Опис шукається через tsvector, марка/модель - через триграмний індекс.
+    Очікує аліаси sa / b / m у запиті.
+    """
+    # '%' і '_' у запиті шукаються буквально, а не як шаблон
+    like = f"%{escape_like(search)}%"
+    condition = f"""(
+        sa.search_vector @@ websearch_to_tsquery('{SEARCH_CONFIG}', %s)
+        OR b.name ILIKE %s ESCAPE '\\'
+        OR m.name ILIKE %s ESCAPE '\\'
+    )"""
+    rank = f"""(
+        ts_rank(sa.search_vector, websearch_to_tsquery('{SEARCH_CONFIG}', %s))
+        + CASE WHEN b.name ILIKE %s ESCAPE '\\' OR m.name ILIKE %s ESCAPE '\\' THEN 1 ELSE 0 END
+    )"""
+    return condition, [search, like, like], rank, [search, like, like]
+
+
+def normalize_specs(specs):
+    """Приводить фільтр характеристик до вигляду, в якому вони лежать у Cars.specs."""
+    return {str(k).strip(): str(v).strip().lower() for k, v in specs.items() if k and v and str(v).strip()}
+
+
+def parse_spec_filters(raw_filters):
+    """
+    Розбирає фільтри виду ["Паливо=Дизель", "Коробка=Автомат"] у словник.
+    Кидає ValueError, якщо рядок не містить '='.
+    """
+    specs = {}
+    for item in raw_filters or []:
+        if "=" not in item:
+            raise ValueError(f"Некоректний фільтр характеристики: '{item}' (очікується назва=значення)")
+        name, value = item.split("=", 1)
+        specs[name] = value
+    return normalize_specs(specs)
+
+
+def spec_clause(specs):
+    """
+    Умова для фільтрації по характеристиках через JSONB-проекцію Cars.specs
+    (GIN-індекс, див. migrations/003_car_specs.sql). Очікує аліас c у запиті.
+    """
+    return "c.specs @> %s::jsonb", [json.dumps(normalize_specs(specs), ensure_ascii=False)]
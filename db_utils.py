@@ -1,16 +1,36 @@
+import io
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
 import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 import streamlit as st
 import pandas as pd
 from config import DB_ROLES  # Імпортуємо словник ролей
 
+# Опціонально: стовпчиковий шлях fetch="arrow" (COPY -> Arrow без Python-циклу по рядках)
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = pa_csv = None
 
-def get_db_connection():
+# Пул з'єднань для паралельних звітів і експорту (на роль, спільний для всіх сесій процесу)
+POOL_MAX_CONN = 8
+POOL_WAIT = 30  # скільки секунд чекаємо на вільне з'єднання
+_pools = {}
+_pool_slots = {}  # семафор на роль: ThreadedConnectionPool при вичерпанні кидає PoolError, а не чекає
+_pools_lock = threading.Lock()
+
+
+def current_role_key():
     """
-    Створює з'єднання з БД, використовуючи роль поточного користувача.
+    Ключ ролі для підключення.
+    Якщо ми в Streamlit і користувач залогінений -> беремо його роль
+    Якщо ні (наприклад, екран логіну або скрипт) -> беремо 'default' (адмінський доступ)
     """
-    # 1. Визначаємо роль
-    # Якщо ми в Streamlit і користувач залогінений -> беремо його роль
-    # Якщо ні (наприклад, екран логіну або скрипт) -> беремо 'default' (адмінський доступ)
     role_key = 'default'
 
     try:
@@ -19,18 +39,185 @@ def get_db_connection():
     except:
         pass  # Ми не в Streamlit, використовуємо default
 
-    # 2. Беремо конфіг для цієї ролі
-    config = DB_ROLES.get(role_key, DB_ROLES['default'])
+    return role_key if role_key in DB_ROLES else 'default'
+
+
+def get_db_connection():
+    """
+    Створює з'єднання з БД, використовуючи роль поточного користувача.
+    """
+    # 1. Визначаємо роль, 2. Беремо конфіг для цієї ролі, 3. Підключаємось
+    return psycopg2.connect(**DB_ROLES[current_role_key()])
+
+
+def get_pool(role_key):
+    """Лінивий ThreadedConnectionPool для ролі."""
+    with _pools_lock:
+        if role_key not in _pools:
+            _pools[role_key] = ThreadedConnectionPool(1, POOL_MAX_CONN, **DB_ROLES[role_key])
+            _pool_slots[role_key] = threading.BoundedSemaphore(POOL_MAX_CONN)
+        return _pools[role_key]
+
+
+@contextmanager
+def pooled_connection(role_key, wait=POOL_WAIT):
+    """
+    З'єднання з пулу ролі. Якщо всі POOL_MAX_CONN зайняті - чекаємо до wait секунд.
+    Після роботи транзакція відкочується; зламане з'єднання (обрив, рестарт БД) закривається, а не повертається в пул.
+    """
+    pool = get_pool(role_key)
+    slots = _pool_slots[role_key]
+    if not slots.acquire(timeout=wait):
+        raise TimeoutError(f"Немає вільного з'єднання з БД ({wait} с)")
+
+    conn = None
+    try:
+        conn = pool.getconn()
+        yield conn
+    finally:
+        try:
+            if conn is not None:
+                broken = bool(conn.closed)
+                if not broken:
+                    try:
+                        conn.rollback()  # лише читання; повертаємо в пул чисте з'єднання
+                    except psycopg2.Error:
+                        broken = True
+                pool.putconn(conn, close=broken)
+        finally:
+            slots.release()
+
+
+def _pooled_query(role_key, query, params, deadline):
+    # Очікування з'єднання і сам запит вкладаються в один спільний дедлайн
+    with pooled_connection(role_key, wait=max(deadline - time.monotonic(), 0)) as conn, conn.cursor() as cur:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Дедлайн минув під час очікування з'єднання")
+        # Сервер сам перерве запит, якщо він не вклався в решту часу
+        cur.execute("SET LOCAL statement_timeout = %s", (max(int(remaining * 1000), 1),))
+        cur.execute(query, params)
+        data = cur.fetchall()
+        columns = [desc[0] for desc in cur.description]
+    return pd.DataFrame(data, columns=columns)
+
+
+def run_queries_parallel(queries, timeout=30):
+    """
+    Виконує кілька SELECT-запитів одночасно на з'єднаннях з пулу.
+    queries: {назва: (sql, params)}.
+    Повертає (results, errors): {назва: DataFrame або None}, {назва: текст помилки}.
+    Час виконання ~ найповільніший запит, а не сума, і не більше timeout на всю групу
+    (разом з очікуванням вільного з'єднання).
+    """
+    # Роль визначаємо тут: у робочих потоках немає st.session_state
+    role_key = current_role_key()
+    deadline = time.monotonic() + timeout
+    results, errors = {}, {}
+
+    executor = ThreadPoolExecutor(max_workers=min(len(queries), POOL_MAX_CONN) or 1)
+    futures = {name: executor.submit(_pooled_query, role_key, sql, params, deadline)
+               for name, (sql, params) in queries.items()}
+    # Запас на мережу: statement_timeout спрацьовує на сервері, відповідь про скасування ще має дійти
+    done, _ = wait(futures.values(), timeout=timeout + 1)
+    # Не чекаємо завислі потоки: їх запити обірве statement_timeout, а з'єднання повернуться в пул
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    for name, future in futures.items():
+        if future not in done:
+            results[name], errors[name] = None, f"Перевищено час очікування ({timeout} с)"
+            continue
+        try:
+            results[name] = future.result()
+        except (TimeoutError, psycopg2.errors.QueryCanceled):
+            results[name], errors[name] = None, f"Перевищено час очікування ({timeout} с)"
+        except psycopg2.errors.InsufficientPrivilege:
+            results[name], errors[name] = None, "У вашої ролі немає прав на виконання цієї дії!"
+        except Exception as e:
+            results[name], errors[name] = None, str(e)
+
+    return results, errors
+
+
+ARROW_FETCH = ("arrow", "arrow_pandas", "arrow_df", "polars")
+
+# OID типу Postgres -> тип Arrow. Типи беремо з опису запиту, а не вгадуємо з тексту CSV:
+# інакше телефон "0501234567" став би int64 без нуля, а numeric - float64.
+_PG_ARROW_TYPES = {
+    16: 'bool', 20: 'int64', 21: 'int16', 23: 'int32', 26: 'int64',
+    700: 'float32', 701: 'float64', 1082: 'date32',
+}
+
 
-    # 3. Підключаємось
-    return psycopg2.connect(**config)
+def _arrow_type(desc):
+    if desc.type_code in _PG_ARROW_TYPES:
+        return pa.type_for_alias(_PG_ARROW_TYPES[desc.type_code])
+    if desc.type_code == 1700:
+        # numeric(p,s) -> точний decimal; numeric без точності (AVG, SUM тощо) - float64
+        if desc.precision and desc.scale is not None:
+            return pa.decimal128(desc.precision, desc.scale)
+        return pa.float64()
+    if desc.type_code == 1114:
+        return pa.timestamp('us')
+    if desc.type_code == 1184:
+        return pa.timestamp('us', tz='UTC')
+    return pa.string()  # text/varchar/uuid/json та інші - як є, без вгадування
+
+
+def _copy_to_arrow(cur, query, params, fetch):
+    """
+    SELECT -> COPY (...) TO STDOUT CSV -> pyarrow.Table, розбір CSV виконує Arrow (C++).
+    Типи стовпців - з опису запиту в Postgres (LIMIT 0), а не з тексту.
+    fetch: "arrow" - pyarrow.Table, "arrow_pandas" - DataFrame з ArrowDtype,
+    "arrow_df" - звичайний pandas DataFrame (як fetch="all"), "polars" - polars.DataFrame.
+    """
+    if pa_csv is None:
+        raise RuntimeError(f"Для fetch='{fetch}' потрібен пакет pyarrow.")
+
+    # COPY не приймає параметри - підставляємо їх на клієнті тим самим екрануванням psycopg2
+    sql = cur.mogrify(query, params).decode('utf-8').strip().rstrip(';')
+    cur.execute(f"SELECT * FROM ({sql}) q LIMIT 0")
+    column_types = {desc.name: _arrow_type(desc) for desc in cur.description}
+
+    # timestamptz у CSV - у часовому поясі сесії; UTC дає однозначне зміщення
+    cur.execute("SET TIME ZONE 'UTC'")
+    buf = io.BytesIO()
+    cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)", buf)
+    buf.seek(0)
+
+    # У CSV від Postgres NULL - порожнє поле без лапок, а порожній рядок - ""
+    table = pa_csv.read_csv(buf, convert_options=pa_csv.ConvertOptions(
+        column_types=column_types,
+        strings_can_be_null=True, quoted_strings_can_be_null=False,
+        true_values=["t"], false_values=["f"]))
+
+    if fetch == "arrow_pandas":
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    if fetch == "arrow_df":
+        return table.to_pandas()
+    if fetch == "polars":
+        import polars as pl  # опціональна залежність, потрібна лише для цього режиму
+        return pl.from_arrow(table)
+    return table
 
 
 def run_query(query, params=None, fetch="none", commit=False):
+    """
+    fetch: "none", "one" (кортеж), "all" (pandas DataFrame)
+    або стовпчикові режими з ARROW_FETCH (див. _copy_to_arrow) - для великих вибірок.
+    "arrow_df" без pyarrow працює як "all", тож його можна використовувати в завантажувачах сторінок.
+    """
     conn = None
     try:
         conn = get_db_connection()  # <--- Тут тепер магія вибору ролі
         cur = conn.cursor()
+        if fetch == "arrow_df" and pa_csv is None:
+            fetch = "all"
+        if fetch in ARROW_FETCH:
+            result = _copy_to_arrow(cur, query, params, fetch)
+            cur.close()
+            return result
+
         cur.execute(query, params)
 
         if commit:
@@ -61,6 +248,40 @@ def run_query(query, params=None, fetch="none", commit=False):
         if conn: conn.close()
 
 
+# Кеш (марка, модель) -> model_id. Записи з довідників ніхто не видаляє,
+# тому кешуємо лише вже закомічені (не щойно вставлені в поточній транзакції) рядки.
+_model_ids = {}
+
+
+def get_or_create_model(cur, brand, model):
+    """
+    Повертає model_id для пари марка/модель, створюючи їх за потреби.
+    Один запит (INSERT ... ON CONFLICT ... RETURNING) замість SELECT + INSERT для марки і моделі,
+    тому безпечно при одночасних реєстраціях. Працює в транзакції переданого курсора.
+    """
+    brand, model = brand.strip(), model.strip()
+    key = (brand, model)
+    if key in _model_ids:
+        return _model_ids[key]
+
+    cur.execute("""
+        WITH b AS (
+            INSERT INTO "Brands" (name) VALUES (%s)
+            ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+            RETURNING brand_id
+        )
+        INSERT INTO "Models" (brand_id, name)
+        SELECT brand_id, %s FROM b
+        ON CONFLICT (brand_id, name) DO UPDATE SET name = EXCLUDED.name
+        RETURNING model_id, (xmax = 0) AS inserted;
+    """, (brand, model))
+    model_id, inserted = cur.fetchone()
+
+    if not inserted:
+        _model_ids[key] = model_id
+    return model_id
+
+
 # Функція логування (завжди пише від імені менеджера або адміна,
 # або можна дати права на INSERT в Audit_Logs всім)
 def log_action(user_id, action_type, table_name, record_id, details):
@@ -79,4 +300,24 @@ def log_action(user_id, action_type, table_name, record_id, details):
     except Exception as e:
         print(f"Audit Error: {e}")
     finally:
-        if conn: conn.close()
\ No newline at end of file
+        if conn: conn.close()
+
+
+def log_actions(user_id, action_type, table_name, record_ids, details):
+    """Пакетне логування: один INSERT на весь набір записів (напр. масова модерація)."""
+    if not record_ids:
+        return
+    conn = None
+    try:
+        conn = psycopg2.connect(**DB_ROLES['default'])
+        cur = conn.cursor()
+        execute_values(cur, """
+            INSERT INTO "Audit_Logs" (user_id, action_type, table_name, record_id, details)
+            VALUES %s;
+        """, [(user_id, action_type, table_name, int(rid), details) for rid in record_ids])
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        print(f"Audit Error: {e}")
+    finally:
+        if conn: conn.close()
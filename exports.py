@@ -0,0 +1,215 @@
+# exports.py
+# Фонові задачі експорту: рядки стрімляться з БД у стиснутий файл на диску, сторінка лише показує прогрес.
+import csv
+import datetime
+import decimal
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from db_utils import current_role_key, pooled_connection
+
+# --- КОНСТАНТИ ---
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "marketplace_exports")
+EXPORT_BATCH = 2000       # рядків за один fetch з серверного курсора
+EXPORT_TIMEOUT = 300      # секунд на весь запит експорту
+EXPORT_TTL = 3600         # скільки зберігаємо готові файли
+EXPORT_WORKERS = 2
+EXPORT_POLL = 1            # секунд між оновленнями прогресу на сторінці
+EXPORT_SWEEP = 600        # як часто фоновий потік прибирає прострочені файли
+EXPORT_FORMATS = {
+    'csv': ("CSV", "application/gzip"),
+    'json': ("JSON", "application/gzip"),
+}
+
+# Стан задач спільний для всіх сесій процесу: {job_id: {...}}
+_jobs = {}
+_jobs_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return str(value)
+
+
+def _update(job_id, **fields):
+    with _jobs_lock:
+        _jobs[job_id].update(fields)
+
+
+def _cleanup():
+    """Видаляє старі файли та записи задач, включно з покинутими файлами попередніх запусків процесу."""
+    cutoff = time.time() - EXPORT_TTL
+    with _jobs_lock:
+        expired = [job_id for job_id, job in _jobs.items()
+                   if job['state'] != 'running' and job['started'] < cutoff]
+        for job_id in expired:
+            path = _jobs.pop(job_id)['path']
+            if os.path.exists(path):
+                os.remove(path)
+        known = {job['path'] for job in _jobs.values()}
+
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if path not in known and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass  # файл уже прибрав інший процес
+
+
+def _sweeper():
+    while True:
+        try:
+            _cleanup()
+        except Exception as e:
+            print(f"Export cleanup error: {e}")
+        time.sleep(EXPORT_SWEEP)
+
+
+# Прибирання по таймеру (і одразу при старті), а не лише коли хтось запускає новий експорт
+threading.Thread(target=_sweeper, daemon=True, name="export-sweeper").start()
+
+
+def _run_export(job_id, role_key, query, params, fmt, tail=None):
+    path = _jobs[job_id]['path']
+    try:
+        # Отримання з'єднання теж усередині try: помилка пулу/БД має позначити задачу як 'error'
+        with pooled_connection(role_key) as conn:
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL statement_timeout = %s", (EXPORT_TIMEOUT * 1000,))
+
+            # Іменований (серверний) курсор: у пам'яті лише один батч, а не весь результат
+            with conn.cursor(name=f"export_{job_id}") as cur, \
+                    gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+                cur.execute(query, params)
+                batch = cur.fetchmany(EXPORT_BATCH)
+                columns = [desc[0] for desc in cur.description]
+                writer = csv.writer(f) if fmt == 'csv' else None
+                if writer:
+                    writer.writerow(columns)
+                else:
+                    f.write("[")
+
+                rows_done = 0
+
+                def write(rows):
+                    nonlocal rows_done
+                    if writer:
+                        writer.writerows(rows)
+                    else:
+                        f.write(("," if rows_done else "") + ",".join(
+                            json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=_json_default)
+                            for row in rows))
+                    rows_done += len(rows)
+                    _update(job_id, rows=rows_done)
+
+                while batch:
+                    write(batch)
+                    batch = cur.fetchmany(EXPORT_BATCH)
+
+                # Додаткове джерело з тими самими стовпцями (напр. архів протоколу), дописується в кінець
+                for batch in (tail() if tail else ()):
+                    write(batch)
+
+                if fmt == 'json':
+                    f.write("]")
+
+        _update(job_id, state='done', finished=time.time())
+    except Exception as e:
+        if os.path.exists(path):
+            os.remove(path)
+        _update(job_id, state='error', error=str(e))
+
+
+def start_export(query, params, fmt, filename_prefix, total=None, tail=None):
+    """
+    Ставить експорт у чергу і одразу повертає job_id.
+    total - очікувана кількість рядків (якщо відома) для відсотка прогресу.
+    tail - необов'язкова функція без аргументів, що повертає батчі рядків після результату query.
+    """
+    _cleanup()
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+
+    job_id = uuid.uuid4().hex
+    with _jobs_lock:
+        _jobs[job_id] = {
+            'state': 'running', 'rows': 0, 'total': total, 'error': None,
+            'path': os.path.join(EXPORT_DIR, f"{job_id}.{fmt}.gz"),
+            'file_name': f"{filename_prefix}.{fmt}.gz",
+            'fmt': fmt, 'started': time.time(), 'finished': None,
+        }
+
+    # Роль визначаємо тут: у робочому потоці немає st.session_state
+    _executor.submit(_run_export, job_id, current_role_key(), query, params, fmt, tail)
+    return job_id
+
+
+def job_status(job_id):
+    """Копія стану задачі або None, якщо задачу вже прибрано."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+@st.fragment(run_every=EXPORT_POLL)
+def _export_progress(job_id):
+    """Прогрес задачі; фрагмент оновлюється сам по таймеру, не займаючи потік скрипта між оновленнями."""
+    job = job_status(job_id)
+    if job is None or job['state'] != 'running':
+        st.rerun()  # задача завершилась - перемальовуємо панель з кнопкою завантаження, таймер зникає
+    if job['total']:
+        st.progress(min(job['rows'] / job['total'], 1.0), text=f"Експорт: {job['rows']} / {job['total']} рядків")
+    else:
+        st.progress(0.0, text=f"Експорт: {job['rows']} рядків")
+
+
+@st.fragment
+def export_panel(key, query, params, filename_prefix, total=None, tail=None):
+    """
+    Кнопки експорту CSV/JSON. Файл формується лише після натискання, у фоні;
+    поки задача працює, прогрес оновлює вкладений фрагмент з run_every.
+    """
+    state_key = f"export_job_{key}"
+    cols = st.columns(len(EXPORT_FORMATS))
+
+    for col, (fmt, (label, _)) in zip(cols, EXPORT_FORMATS.items()):
+        if col.button(f"Сформувати {label}", key=f"export_{key}_{fmt}"):
+            st.session_state[state_key] = start_export(query, params, fmt, filename_prefix, total, tail)
+
+    job_id = st.session_state.get(state_key)
+    job = job_status(job_id) if job_id else None
+    if job is None:
+        return
+
+    if job['state'] == 'running':
+        _export_progress(job_id)
+
+    elif job['state'] == 'error':
+        st.error(f"Помилка експорту: {job['error']}")
+
+    else:
+        # Файл віддаємо одноразово: download_button кладе весь вміст у сесію при кожному рендері,
+        # тож після першого показу кнопку малюємо знову лише на прохання користувача
+        shown_key = f"export_shown_{key}"
+        if st.session_state.get(shown_key) == job_id and not st.button(
+                f"📄 {job['file_name']} ({job['rows']} рядків) - отримати ще раз", key=f"export_again_{key}"):
+            return
+        st.session_state[shown_key] = job_id
+        with open(job['path'], "rb") as f:
+            st.download_button(
+                f"⬇️ Завантажити {job['file_name']} ({job['rows']} рядків)",
+                data=f, file_name=job['file_name'], mime=EXPORT_FORMATS[job['fmt']][1],
+                key=f"download_{key}", on_click="ignore"
+            )
@@ -0,0 +1,118 @@
+# facets.py
+# Фасети для фільтрів сайдбару: марка -> модель з кількістю та діапазони значень.
+# Дані беруться з матеріалізованого представлення facet_summary (migrations/002_facet_summary.sql),
+# тому сторінкам не треба крутити unique()/min()/max() по всьому датасету.
+import threading
+import time
+import psycopg2
+import pandas as pd
+import streamlit as st
+from config import DB_ROLES
+from db_utils import run_query
+
+# Як часто (сек) перераховуємо фасети
+FACET_TTL = 60
+
+_last_refresh = 0.0
+_refreshing = False
+_pending = False      # запит на оновлення надійшов, поки попереднє ще виконувалось
+_refresh_lock = threading.Lock()
+
+
+def _refresh():
+    global _refreshing, _pending
+    while True:
+        conn = None
+        try:
+            # REFRESH може виконати лише власник представлення -> дефолтне (адмінське) з'єднання
+            conn = psycopg2.connect(**DB_ROLES['default'])
+            cur = conn.cursor()
+            cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY public.facet_summary;")
+            conn.commit()
+            cur.close()
+            # Кеш скидаємо лише після REFRESH: інакше наступний рендер знову закешував би старі фасети
+            load_facets.clear()
+        except Exception as e:
+            print(f"Facet refresh error: {e}")
+        finally:
+            if conn: conn.close()
+
+        with _refresh_lock:
+            if not _pending:
+                _refreshing = False
+                return
+            _pending = False
+
+
+def refresh_facets(force=False):
+    """
+    Оновлює facet_summary у фоновому потоці, не частіше, ніж раз на FACET_TTL секунд (force - одразу).
+    Рендер сторінки не чекає на REFRESH; одночасно виконується не більше одного оновлення,
+    а force під час оновлення ставить ще одне в чергу, щоб не загубити свіжі зміни.
+    """
+    global _last_refresh, _refreshing, _pending
+    with _refresh_lock:
+        if _refreshing:
+            _pending = _pending or force
+            return
+        if not force and time.time() - _last_refresh < FACET_TTL:
+            return
+        _refreshing, _last_refresh = True, time.time()
+    threading.Thread(target=_refresh, daemon=True, name="facet-refresh").start()
+
+
+@st.cache_data(ttl=FACET_TTL)
+def load_facets(entity):
+    """Рядки фасетів (brand, model, cnt, min_/max_ price/year/mileage) для сутності."""
+    refresh_facets()
+    df = run_query("""
+        SELECT brand, model, cnt, min_price, max_price, min_year, max_year, min_mileage, max_mileage
+        FROM public.facet_summary
+        WHERE entity = %s
+        ORDER BY brand, model;
+    """, (entity,), fetch="all")
+    return df if df is not None else pd.DataFrame(columns=['brand', 'model', 'cnt'])
+
+
+def _select(facets, brands=None, models=None):
+    sel = facets
+    if brands:
+        sel = sel[sel['brand'].isin(brands)]
+    if models:
+        sel = sel[sel['model'].isin(models)]
+    return sel
+
+
+def brand_counts(facets):
+    """Series {марка: кількість}, відсортована за назвою."""
+    if facets.empty:
+        return pd.Series(dtype='int64')
+    return facets.groupby('brand')['cnt'].sum().sort_index()
+
+
+def model_counts(facets, brands=None):
+    """Series {модель: кількість} з урахуванням обраних марок."""
+    sel = _select(facets, brands)
+    if sel.empty:
+        return pd.Series(dtype='int64')
+    return sel.groupby('model')['cnt'].sum().sort_index()
+
+
+def facet_range(facets, field, brands=None, models=None, default=(0, 100000)):
+    """
+    (min, max) для поля price / year / mileage з урахуванням обраних марок та моделей.
+    Фасети можуть відставати від БД до FACET_TTL: використовуйте як значення за замовчуванням у полях,
+    а межу, яку користувач не змінював, передавайте у фільтр як відкриту (див. open_bound).
+    """
+    sel = _select(facets, brands, models)
+    if sel.empty:
+        return default
+    lo, hi = sel[f'min_{field}'].min(), sel[f'max_{field}'].max()
+    if pd.isna(lo) or pd.isna(hi):
+        return default
+    return int(lo), int(hi)
+
+
+def open_bound(value, default):
+    """None, якщо користувач лишив значення за замовчуванням із фасетів (межа не обмежує), інакше value."""
+    return None if value == default else value
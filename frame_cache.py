@@ -0,0 +1,189 @@
+# frame_cache.py
+# Спільний кеш DataFrame-ів для завантажувачів сторінок.
+# На відміну від st.cache_data (кожен виклик = розпаковка нової копії з pickle), повертає той самий об'єкт
+# усім сесіям процесу: компактні типи + один бюджет пам'яті на весь процес з LRU-витісненням між кешами.
+# Спільні кадри доступні лише для читання (див. _freeze): глобальні налаштування pandas не змінюємо.
+import functools
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import streamlit as st
+from facets import refresh_facets
+
+# --- КОНСТАНТИ ---
+CACHE_BUDGET_MB = 512  # спільний для всіх кешів: завантажувачі без аргументів мають по одному запису на кеш
+CATEGORY_RATIO = 0.5   # рядковий стовпець -> category, якщо унікальних значень не більше цієї частки
+
+# Реєстр кешів процесу: {назва: стан}. Скрипти сторінок виконуються заново на кожен перезапуск,
+# тому кеш прив'язаний до (файл, функція), а не до об'єкта функції
+_caches = {}
+# Порядок використання записів усіх кешів: {(назва кешу, ключ): розмір}; першим витісняється найдавніший
+_lru = OrderedDict()
+_usage = {'nbytes': 0}
+_caches_lock = threading.Lock()
+
+
+def compact_frame(df):
+    """Повторювані рядки (марки, статуси, email) -> category, цілі числа -> найменший int."""
+    if df is None or df.empty:
+        return df
+    converted = {}
+    for col in df.columns:
+        series = df[col]
+        if series.dtype == object:
+            values = series.dropna()
+            if not values.map(type).eq(str).all():
+                continue  # Decimal, дати тощо лишаємо як є
+            if values.nunique() <= len(series) * CATEGORY_RATIO:
+                converted[col] = series.astype("category")
+        elif pd.api.types.is_integer_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            converted[col] = pd.to_numeric(series, downcast="integer")
+    return df.assign(**converted) if converted else df
+
+
+def _frames(value):
+    if isinstance(value, pd.DataFrame):
+        return [value]
+    if isinstance(value, (tuple, list)):
+        return [v for v in value if isinstance(v, pd.DataFrame)]
+    return []
+
+
+def _freeze(df):
+    """
+    Кадр для спільного використання: масиви стовпців лише для читання, тож запис на місці
+    (df.loc[...] = ..., inplace=True) кидає ValueError замість того, щоб змінити дані всім сесіям.
+    Фільтрація і df.assign(...) створюють нові об'єкти і працюють як звичайно.
+    """
+    if df is None or df.empty:
+        return df
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy(copy=True)
+            codes.flags.writeable = False
+            columns[col] = pd.Categorical.from_codes(codes, dtype=series.dtype)
+        elif isinstance(series.dtype, np.dtype):
+            values = series.to_numpy(copy=True)
+            values.flags.writeable = False
+            columns[col] = values
+        else:
+            columns[col] = series.array
+    # copy=False: pandas бере масиви як є, не копіюючи і не склеюючи їх у спільний блок
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+def _prepare(df):
+    return _freeze(compact_frame(df))
+
+
+def _compact(value):
+    if isinstance(value, pd.DataFrame):
+        return _prepare(value)
+    if isinstance(value, tuple):
+        return tuple(_prepare(v) if isinstance(v, pd.DataFrame) else v for v in value)
+    return value
+
+
+def _nbytes(value):
+    return int(sum(df.memory_usage(deep=True).sum() for df in _frames(value)))
+
+
+def _cacheable(value):
+    """Помилки завантаження (None) не кешуємо, як і st.cache_data не мав би кешувати невдалий запит."""
+    if value is None:
+        return False
+    return not (isinstance(value, tuple) and any(v is None for v in value))
+
+
+def _evict():
+    """Витісняє найдавніше використані записи будь-якого кешу, поки процес не вкладеться в бюджет.
+    Останній (щойно доданий) запис лишаємо, навіть якщо він сам більший за бюджет. Викликати під _caches_lock."""
+    budget = CACHE_BUDGET_MB * 1024 * 1024
+    while _usage['nbytes'] > budget and len(_lru) > 1:
+        (name, key), size = _lru.popitem(last=False)
+        cache = _caches[name]
+        cache['entries'].pop(key, None)
+        cache['nbytes'] -= size
+        cache['evictions'] += 1
+        _usage['nbytes'] -= size
+
+
+def frame_cache(ttl=None):
+    """
+    Декоратор завантажувача: результат (DataFrame або кортеж з DataFrame) спільний для всіх сесій.
+    Повернуті DataFrame спільні і доступні лише для читання: фільтрувати і робити df.assign(...) можна,
+    а df[col] = ... чи зміну значень на місці - лише на відфільтрованій копії.
+    """
+    def decorator(func):
+        name = f"{func.__code__.co_filename.rsplit('/', 1)[-1]}:{func.__qualname__}"
+        with _caches_lock:
+            cache = _caches.setdefault(name, {
+                'entries': OrderedDict(), 'nbytes': 0, 'hits': 0, 'misses': 0, 'evictions': 0,
+            })
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            with _caches_lock:
+                entry = cache['entries'].get(key)
+                if entry and (ttl is None or time.time() - entry[0] < ttl):
+                    _lru.move_to_end((name, key))
+                    cache['hits'] += 1
+                    return entry[1]
+                cache['misses'] += 1
+
+            value = _compact(func(*args, **kwargs))
+            if not _cacheable(value):
+                return value
+
+            size = _nbytes(value)
+            with _caches_lock:
+                old = cache['entries'].pop(key, None)
+                if old:
+                    cache['nbytes'] -= old[2]
+                    _usage['nbytes'] -= _lru.pop((name, key), 0)
+                cache['entries'][key] = (time.time(), value, size)
+                cache['nbytes'] += size
+                _lru[(name, key)] = size
+                _usage['nbytes'] += size
+                _evict()
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+def clear_caches():
+    """
+    Скидає всі кеші даних: st.cache_data і frame_cache (викликати після змін у БД).
+    Фасети перераховуються у фоні; load_facets скидається ще раз, коли REFRESH завершиться.
+    """
+    st.cache_data.clear()
+    refresh_facets(force=True)
+    with _caches_lock:
+        for cache in _caches.values():
+            cache['entries'].clear()
+            cache['nbytes'] = 0
+        _lru.clear()
+        _usage['nbytes'] = 0
+
+
+def cache_stats():
+    """Зведення по кешах для адміністратора (бюджет спільний, share - частка кешу в ньому)."""
+    budget = CACHE_BUDGET_MB * 1024 * 1024
+    with _caches_lock:
+        rows = [{
+            'cache': name,
+            'entries': len(c['entries']),
+            'size_mb': round(c['nbytes'] / 1024 / 1024, 2),
+            'share': round(c['nbytes'] / budget, 3),
+            'hits': c['hits'],
+            'misses': c['misses'],
+            'evictions': c['evictions'],
+        } for name, c in _caches.items()]
+    return pd.DataFrame(rows)
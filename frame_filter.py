@@ -0,0 +1,89 @@
+# frame_filter.py
+# Спільний рушій фільтрів бокової панелі: пошук по заздалегідь зібраному ключу + isin/діапазони одним проходом.
+# Для (версія набору даних, кортеж фільтрів) запам'ятовуються лише позиції рядків, а не копії DataFrame:
+# пам'ять пам'ятки - 8 байт на відібраний рядок, тож вона не роздуває бюджет frame_cache.
+# Версія набору - сам об'єкт DataFrame: frame_cache повертає той самий об'єкт, доки кеш не скинуто.
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+
+# --- КОНСТАНТИ ---
+MEMO_SIZE = 16        # скільки останніх наборів позицій тримаємо на один набір даних
+KEY_SEP = "\x1f"      # роздільник стовпців у ключі пошуку (не набирається з клавіатури)
+
+# {id(df): {'keys': {стовпці: Series}, 'results': OrderedDict}} - запис зникає разом з DataFrame
+_state = {}
+_state_lock = threading.Lock()
+
+
+def _frame_state(df):
+    with _state_lock:
+        state = _state.get(id(df))
+        if state is None:
+            state = _state[id(df)] = {'keys': {}, 'results': OrderedDict(), 'lock': threading.Lock()}
+            weakref.finalize(df, _state.pop, id(df), None)
+        return state
+
+
+def _search_key(df, state, columns):
+    """Нижній регістр усіх стовпців пошуку в одному рядку; рахується один раз на набір даних."""
+    key = state['keys'].get(columns)
+    if key is None:
+        parts = [df[col].astype(str).where(df[col].notna(), "") for col in columns]
+        key = parts[0].str.cat(parts[1:], sep=KEY_SEP).str.lower() if len(parts) > 1 else parts[0].str.lower()
+        state['keys'][columns] = key
+    return key
+
+
+def _as_bool(mask):
+    return mask.to_numpy(dtype=bool, na_value=False)
+
+
+def filter_frame(df, search="", search_cols=(), isin=None, exclude=None, equals=None, ranges=None):
+    """
+    Фільтрує df і повертає новий DataFrame з відібраними рядками.
+    Результат щоразу новий об'єкт, тож усі умови однієї вибірки передаємо одним викликом, а не ланцюжком.
+    search      - підрядок без урахування регістру в будь-якому з search_cols (без regex)
+    isin        - {стовпець: значення}; порожній набір = фільтр вимкнено
+    exclude     - {стовпець: значення, які треба прибрати}
+    equals      - {стовпець: значення}
+    ranges      - {стовпець: (від, до)} включно; None = межа відкрита
+    """
+    if df is None or df.empty:
+        return df
+
+    search = (search or "").strip().lower()
+    isin = {col: tuple(vals) for col, vals in (isin or {}).items() if len(vals)}
+    exclude = {col: tuple(vals) for col, vals in (exclude or {}).items() if len(vals)}
+    equals, ranges = equals or {}, ranges or {}
+    memo_key = (search, tuple(search_cols), tuple(sorted(isin.items())), tuple(sorted(exclude.items())),
+                tuple(sorted(equals.items())), tuple(sorted(ranges.items())))
+
+    state = _frame_state(df)
+    with state['lock']:
+        positions = state['results'].get(memo_key)
+        if positions is not None:
+            state['results'].move_to_end(memo_key)
+            return df.take(positions)
+
+        masks = []
+        if search and search_cols:
+            masks.append(_as_bool(_search_key(df, state, tuple(search_cols)).str.contains(search, regex=False)))
+        masks += [_as_bool(df[col].isin(vals)) for col, vals in isin.items()]
+        masks += [~_as_bool(df[col].isin(vals)) for col, vals in exclude.items()]
+        masks += [_as_bool(df[col] == val) for col, val in equals.items()]
+        for col, (low, high) in ranges.items():
+            if low is not None:
+                masks.append(_as_bool(df[col] >= low))
+            if high is not None:
+                masks.append(_as_bool(df[col] <= high))
+
+        if not masks:
+            return df
+        positions = np.flatnonzero(np.logical_and.reduce(masks))
+
+        state['results'][memo_key] = positions
+        if len(state['results']) > MEMO_SIZE:
+            state['results'].popitem(last=False)
+        return df.take(positions)
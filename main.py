@@ -1,7 +1,6 @@
 import streamlit as st
 from auth import login_user, register_user
-from navigation import make_sidebar  # <--- ІМПОРТУЄМО НАВІГАЦІЮ
-import time
+from navigation import make_sidebar, show_flash, post_action  # <--- ІМПОРТУЄМО НАВІГАЦІЮ
 
 # Налаштування сторінки має бути першим
 st.set_page_config(page_title="Car Marketplace", page_icon="🚗", layout="centered")
@@ -13,6 +12,10 @@ if 'role' not in st.session_state:
     st.session_state['role'] = None
 if 'username' not in st.session_state:
     st.session_state['username'] = None
+if 'employee_id' not in st.session_state:
+    st.session_state['employee_id'] = None
+
+show_flash()
 
 
 # --- ФУНКЦІЯ ВИХОДУ ---
@@ -20,6 +23,7 @@ def logout():
     st.session_state['user_id'] = None
     st.session_state['role'] = None
     st.session_state['username'] = None
+    st.session_state['employee_id'] = None
     st.rerun()
 
 
@@ -45,9 +49,8 @@ if st.session_state['user_id'] is None:
                     st.session_state['user_id'] = user['id']
                     st.session_state['role'] = user['role']
                     st.session_state['username'] = user['name']
-                    st.success(f"Вітаємо, {user['name']}! ({user['role']})")
-                    time.sleep(1)
-                    st.rerun()
+                    st.session_state['employee_id'] = user['employee_id']
+                    post_action(f"Вітаємо, {user['name']}! ({user['role']})")
                 else:
                     st.error("Невірний email або пароль.")
 
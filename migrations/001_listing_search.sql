@@ -0,0 +1,22 @@
+-- Повнотекстовий пошук по оголошеннях + триграмний пошук по марках/моделях.
+-- Скрипт ідемпотентний: можна запускати повторно.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- 1. tsvector по заголовку та опису (конфіг 'simple' - працює для української без словників)
+ALTER TABLE public."Sale_Announcements"
+    ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_sale_announcements_search
+    ON public."Sale_Announcements" USING GIN (search_vector);
+
+-- 2. Триграми для пошуку підрядка (ILIKE '%...%') по марці та моделі
+CREATE INDEX IF NOT EXISTS idx_brands_name_trgm
+    ON public."Brands" USING GIN (name gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_models_name_trgm
+    ON public."Models" USING GIN (name gin_trgm_ops);
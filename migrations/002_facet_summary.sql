@@ -0,0 +1,67 @@
+-- Агреговані фасети для фільтрів сайдбару (марка -> модель, діапазони цін/років/пробігу).
+-- Оновлюється через REFRESH MATERIALIZED VIEW CONCURRENTLY (див. facets.py).
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.facet_summary AS
+-- Активні оголошення
+SELECT 'listings'::text AS entity, b.name AS brand, m.name AS model, COUNT(*) AS cnt,
+       MIN(sa.price)::numeric AS min_price, MAX(sa.price)::numeric AS max_price,
+       MIN(c.year) AS min_year, MAX(c.year) AS max_year,
+       MIN(c.mileage) AS min_mileage, MAX(c.mileage) AS max_mileage
+FROM public."Sale_Announcements" sa
+JOIN public."Cars" c ON sa.car_id = c.car_id
+JOIN public."Models" m ON c.model_id = m.model_id
+JOIN public."Brands" b ON m.brand_id = b.brand_id
+WHERE sa.status = 'active'
+GROUP BY b.name, m.name
+
+UNION ALL
+-- Угоди (ціна = фінальна ціна угоди)
+SELECT 'deals', b.name, m.name, COUNT(*),
+       MIN(d.final_price)::numeric, MAX(d.final_price)::numeric,
+       MIN(c.year), MAX(c.year), MIN(c.mileage), MAX(c.mileage)
+FROM public."Deals" d
+JOIN public."Sale_Announcements" sa ON d.announcement_id = sa.announcement_id
+JOIN public."Cars" c ON sa.car_id = c.car_id
+JOIN public."Models" m ON c.model_id = m.model_id
+JOIN public."Brands" b ON m.brand_id = b.brand_id
+GROUP BY b.name, m.name
+
+UNION ALL
+-- Заявки на викуп (ціна = бажана ціна клієнта)
+SELECT 'buyback', b.name, m.name, COUNT(*),
+       MIN(br.desired_price)::numeric, MAX(br.desired_price)::numeric,
+       MIN(c.year), MAX(c.year), MIN(c.mileage), MAX(c.mileage)
+FROM public."Buyback_Requests" br
+JOIN public."Cars" c ON br.car_id = c.car_id
+JOIN public."Models" m ON c.model_id = m.model_id
+JOIN public."Brands" b ON m.brand_id = b.brand_id
+GROUP BY b.name, m.name
+
+UNION ALL
+-- Інспекції
+SELECT 'inspections', b.name, m.name, COUNT(*),
+       NULL::numeric, NULL::numeric,
+       MIN(c.year), MAX(c.year), MIN(c.mileage), MAX(c.mileage)
+FROM public."Inspections" i
+JOIN public."Buyback_Requests" br ON i.request_id = br.request_id
+JOIN public."Cars" c ON br.car_id = c.car_id
+JOIN public."Models" m ON c.model_id = m.model_id
+JOIN public."Brands" b ON m.brand_id = b.brand_id
+GROUP BY b.name, m.name
+
+UNION ALL
+-- Перевірені авто
+SELECT 'cars', b.name, m.name, COUNT(*),
+       NULL::numeric, NULL::numeric,
+       MIN(c.year), MAX(c.year), MIN(c.mileage), MAX(c.mileage)
+FROM public."Cars" c
+JOIN public."Models" m ON c.model_id = m.model_id
+JOIN public."Brands" b ON m.brand_id = b.brand_id
+WHERE c.verification_status = 'verified'
+GROUP BY b.name, m.name;
+
+-- Унікальний індекс обов'язковий для REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_facet_summary_key
+    ON public.facet_summary (entity, brand, model);
+
+GRANT SELECT ON public.facet_summary TO db_client, db_manager, db_admin;
@@ -0,0 +1,103 @@
+-- JSONB-проекція EAV-таблиці Car_Characteristics: Cars.specs = {"Назва характеристики": "значення"}.
+-- Значення зберігаються в нижньому регістрі, щоб фільтр "Паливо = дизель" не залежав від регістру.
+
+ALTER TABLE public."Cars"
+    ADD COLUMN IF NOT EXISTS specs jsonb NOT NULL DEFAULT '{}'::jsonb;
+
+CREATE INDEX IF NOT EXISTS idx_cars_specs
+    ON public."Cars" USING GIN (specs jsonb_path_ops);
+
+-- Старий рядковий тригер прибираємо до заміни функції: нова читає таблиці переходу
+DROP TRIGGER IF EXISTS sync_car_specs ON public."Car_Characteristics";
+
+-- Перерахунок specs для набору авто: кожне авто оновлюється один раз, скільки б характеристик не змінилось
+CREATE OR REPLACE FUNCTION public.rebuild_car_specs(p_car_ids integer[]) RETURNS void
+LANGUAGE sql SECURITY DEFINER SET search_path = public, pg_temp AS $$
+    UPDATE public."Cars" c
+    SET specs = COALESCE((
+        SELECT jsonb_object_agg(ch.name, lower(cc.value))
+        FROM public."Car_Characteristics" cc
+        JOIN public."Characteristics" ch ON cc.characteristic_id = ch.characteristic_id
+        WHERE cc.car_id = c.car_id
+    ), '{}'::jsonb)
+    WHERE c.car_id = ANY(p_car_ids);
+$$;
+
+-- Тригер рівня інструкції: масова вставка (car_import) перераховує кожне авто один раз, а не на кожен рядок
+CREATE OR REPLACE FUNCTION public.trg_sync_car_specs() RETURNS trigger
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = public, pg_temp AS $$
+DECLARE
+    v_car_ids integer[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT car_id) INTO v_car_ids FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT car_id) INTO v_car_ids FROM old_rows;
+    ELSE
+        SELECT array_agg(DISTINCT car_id) INTO v_car_ids
+        FROM (SELECT car_id FROM old_rows UNION SELECT car_id FROM new_rows) changed;
+    END IF;
+    IF v_car_ids IS NOT NULL THEN
+        PERFORM public.rebuild_car_specs(v_car_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Назва характеристики - ключ у specs: перейменування перераховує авто, що мають цю характеристику
+CREATE OR REPLACE FUNCTION public.trg_characteristic_renamed() RETURNS trigger
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = public, pg_temp AS $$
+DECLARE
+    v_car_ids integer[];
+BEGIN
+    SELECT array_agg(DISTINCT cc.car_id) INTO v_car_ids
+    FROM new_rows n
+    JOIN old_rows o ON o.characteristic_id = n.characteristic_id
+    JOIN public."Car_Characteristics" cc ON cc.characteristic_id = n.characteristic_id
+    WHERE n.name IS DISTINCT FROM o.name;
+    IF v_car_ids IS NOT NULL THEN
+        PERFORM public.rebuild_car_specs(v_car_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Функції з правами власника не повинні викликатися напряму клієнтськими ролями
+DROP FUNCTION IF EXISTS public.rebuild_car_specs(integer);
+REVOKE EXECUTE ON FUNCTION public.rebuild_car_specs(integer[]) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.trg_sync_car_specs() FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.trg_characteristic_renamed() FROM PUBLIC;
+
+-- Тригер з таблицями переходу може мати лише одну подію, тому три окремі
+DROP TRIGGER IF EXISTS sync_car_specs_ins ON public."Car_Characteristics";
+DROP TRIGGER IF EXISTS sync_car_specs_upd ON public."Car_Characteristics";
+DROP TRIGGER IF EXISTS sync_car_specs_del ON public."Car_Characteristics";
+CREATE TRIGGER sync_car_specs_ins
+    AFTER INSERT ON public."Car_Characteristics"
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.trg_sync_car_specs();
+CREATE TRIGGER sync_car_specs_upd
+    AFTER UPDATE ON public."Car_Characteristics"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.trg_sync_car_specs();
+CREATE TRIGGER sync_car_specs_del
+    AFTER DELETE ON public."Car_Characteristics"
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.trg_sync_car_specs();
+
+DROP TRIGGER IF EXISTS sync_specs_on_rename ON public."Characteristics";
+CREATE TRIGGER sync_specs_on_rename
+    AFTER UPDATE ON public."Characteristics"
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.trg_characteristic_renamed();
+
+-- Початкове заповнення
+UPDATE public."Cars" c
+SET specs = s.specs
+FROM (
+    SELECT cc.car_id, jsonb_object_agg(ch.name, lower(cc.value)) AS specs
+    FROM public."Car_Characteristics" cc
+    JOIN public."Characteristics" ch ON cc.characteristic_id = ch.characteristic_id
+    GROUP BY cc.car_id
+) s
+WHERE c.car_id = s.car_id;
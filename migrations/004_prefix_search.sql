@@ -0,0 +1,8 @@
+-- Індекси для префіксного пошуку (typeahead) користувачів за email та авто за VIN.
+-- text_pattern_ops дозволяє використовувати індекс для LIKE 'abc%' незалежно від collation.
+
+CREATE INDEX IF NOT EXISTS idx_users_email_prefix
+    ON public."Users" (lower(email) text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS idx_cars_vin_prefix
+    ON public."Cars" (upper(vin_code) text_pattern_ops);
@@ -0,0 +1,8 @@
+-- Унікальність довідників марок/моделей для INSERT ... ON CONFLICT (див. db_utils.get_or_create_model).
+-- Якщо в базі вже є дублікати, їх треба злити вручну до запуску скрипта.
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_brands_name
+    ON public."Brands" (name);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_models_brand_name
+    ON public."Models" (brand_id, name);
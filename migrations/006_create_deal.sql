@@ -0,0 +1,42 @@
+-- Атомарне оформлення угоди: блокування оголошення, перевірка статусу і три записи за один виклик.
+-- Коди помилок: MP409 - оголошення вже не активне (конфлікт), MP400 - некоректні дані.
+
+CREATE OR REPLACE FUNCTION public.create_deal(p_announcement_id integer,
+                                              p_buyer_user_id integer,
+                                              p_final_price numeric)
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_status  text;
+    v_car_id  integer;
+    v_seller  integer;
+    v_deal_id integer;
+BEGIN
+    -- Блокуємо рядок оголошення: паралельний продаж того ж авто чекатиме тут
+    SELECT status, car_id, seller_user_id
+    INTO v_status, v_car_id, v_seller
+    FROM public."Sale_Announcements"
+    WHERE announcement_id = p_announcement_id
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Оголошення #% не знайдено', p_announcement_id USING ERRCODE = 'MP400';
+    END IF;
+    IF v_status <> 'active' THEN
+        RAISE EXCEPTION 'Оголошення #% вже не активне (статус: %)', p_announcement_id, v_status
+            USING ERRCODE = 'MP409';
+    END IF;
+    IF v_seller = p_buyer_user_id THEN
+        RAISE EXCEPTION 'Продавець не може купити авто сам у себе' USING ERRCODE = 'MP400';
+    END IF;
+
+    INSERT INTO public."Deals" (announcement_id, buyer_user_id, final_price)
+    VALUES (p_announcement_id, p_buyer_user_id, p_final_price)
+    RETURNING deal_id INTO v_deal_id;
+
+    UPDATE public."Sale_Announcements" SET status = 'sold' WHERE announcement_id = p_announcement_id;
+    UPDATE public."Cars" SET owner_id = p_buyer_user_id WHERE car_id = v_car_id;
+
+    RETURN v_deal_id;
+END;
+$$;
@@ -0,0 +1,4 @@
+-- Індекс під keyset-пагінацію історії угод (ORDER BY deal_date DESC, deal_id DESC).
+
+CREATE INDEX IF NOT EXISTS idx_deals_date_id
+    ON public."Deals" (deal_date DESC, deal_id DESC);
@@ -0,0 +1,8 @@
+-- Черга вільних заявок на викуп для claim_next_request (FOR UPDATE SKIP LOCKED).
+
+CREATE INDEX IF NOT EXISTS idx_buyback_unclaimed
+    ON public."Buyback_Requests" (request_date)
+    WHERE manager_id IS NULL AND status IN ('new', 'processing');
+
+CREATE INDEX IF NOT EXISTS idx_buyback_manager
+    ON public."Buyback_Requests" (manager_id, request_date DESC);
@@ -0,0 +1,17 @@
+-- Збережений середній рейтинг інспекції (пишеться разом з інспекцією, див. pages/Inspections.py)
+-- та індекс під anti-join черги "заявки без інспекції".
+
+ALTER TABLE public."Inspections"
+    ADD COLUMN IF NOT EXISTS avg_rating numeric(3, 1);
+
+UPDATE public."Inspections" i
+SET avg_rating = s.avg_rating
+FROM (
+    SELECT inspection_id, ROUND(AVG(rating), 1) AS avg_rating
+    FROM public."Inspection_Checkpoints"
+    GROUP BY inspection_id
+) s
+WHERE i.inspection_id = s.inspection_id AND i.avg_rating IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_inspections_request
+    ON public."Inspections" (request_id);
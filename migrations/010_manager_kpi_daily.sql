@@ -0,0 +1,150 @@
+-- Щоденні KPI менеджерів, що підтримуються тригерами інкрементально.
+-- Звіт за період читає лише manager_kpi_daily (див. reports.py, звіт 'managers').
+
+-- Момент завершення викупу (раніше не зберігався)
+ALTER TABLE public."Buyback_Requests"
+    ADD COLUMN IF NOT EXISTS completed_at timestamp;
+
+-- Для вже завершених заявок точної дати немає - беремо дату заявки
+UPDATE public."Buyback_Requests"
+SET completed_at = request_date
+WHERE status = 'completed' AND completed_at IS NULL;
+
+CREATE TABLE IF NOT EXISTS public.manager_kpi_daily (
+    manager_id         integer NOT NULL,
+    day                date    NOT NULL,
+    completed_buybacks integer NOT NULL DEFAULT 0,
+    offer_sum          numeric NOT NULL DEFAULT 0,  -- сума offer_price завершених викупів
+    offer_count        integer NOT NULL DEFAULT 0,
+    ratio_sum          numeric NOT NULL DEFAULT 0,  -- сума offer_price / desired_price
+    ratio_count        integer NOT NULL DEFAULT 0,
+    inspections        integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (manager_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_manager_kpi_daily_day
+    ON public.manager_kpi_daily (day);
+
+GRANT SELECT ON public.manager_kpi_daily TO db_admin;
+
+-- Додає (sign = 1) або віднімає (sign = -1) внесок однієї заявки/інспекції
+CREATE OR REPLACE FUNCTION public.kpi_bump(p_manager integer, p_day date, p_sign integer,
+                                           p_completed boolean, p_offer numeric, p_desired numeric,
+                                           p_inspection boolean) RETURNS void
+LANGUAGE sql SECURITY DEFINER SET search_path = public, pg_temp AS $$
+    INSERT INTO public.manager_kpi_daily AS k
+        (manager_id, day, completed_buybacks, offer_sum, offer_count, ratio_sum, ratio_count, inspections)
+    VALUES (
+        p_manager, p_day,
+        CASE WHEN p_completed THEN p_sign ELSE 0 END,
+        CASE WHEN p_completed AND p_offer IS NOT NULL THEN p_sign * p_offer ELSE 0 END,
+        CASE WHEN p_completed AND p_offer IS NOT NULL THEN p_sign ELSE 0 END,
+        CASE WHEN p_completed AND p_offer IS NOT NULL AND p_desired > 0 THEN p_sign * p_offer / p_desired ELSE 0 END,
+        CASE WHEN p_completed AND p_offer IS NOT NULL AND p_desired > 0 THEN p_sign ELSE 0 END,
+        CASE WHEN p_inspection THEN p_sign ELSE 0 END
+    )
+    ON CONFLICT (manager_id, day) DO UPDATE SET
+        completed_buybacks = k.completed_buybacks + EXCLUDED.completed_buybacks,
+        offer_sum          = k.offer_sum + EXCLUDED.offer_sum,
+        offer_count        = k.offer_count + EXCLUDED.offer_count,
+        ratio_sum          = k.ratio_sum + EXCLUDED.ratio_sum,
+        ratio_count        = k.ratio_count + EXCLUDED.ratio_count,
+        inspections        = k.inspections + EXCLUDED.inspections;
+$$;
+
+-- Buyback_Requests: фіксуємо completed_at при переході в 'completed'
+CREATE OR REPLACE FUNCTION public.trg_buyback_completed_at() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF NEW.status = 'completed' AND (TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM 'completed') THEN
+        NEW.completed_at := COALESCE(NEW.completed_at, now());
+    ELSIF NEW.status IS DISTINCT FROM 'completed' THEN
+        NEW.completed_at := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS buyback_completed_at ON public."Buyback_Requests";
+CREATE TRIGGER buyback_completed_at
+    BEFORE INSERT OR UPDATE ON public."Buyback_Requests"
+    FOR EACH ROW EXECUTE FUNCTION public.trg_buyback_completed_at();
+
+-- Buyback_Requests: прибираємо старий внесок і додаємо новий
+CREATE OR REPLACE FUNCTION public.trg_buyback_kpi() RETURNS trigger
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = public, pg_temp AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'completed' AND OLD.manager_id IS NOT NULL
+            AND OLD.completed_at IS NOT NULL THEN
+        PERFORM public.kpi_bump(OLD.manager_id, OLD.completed_at::date, -1, true,
+                                OLD.offer_price, OLD.desired_price, false);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'completed' AND NEW.manager_id IS NOT NULL
+            AND NEW.completed_at IS NOT NULL THEN
+        PERFORM public.kpi_bump(NEW.manager_id, NEW.completed_at::date, 1, true,
+                                NEW.offer_price, NEW.desired_price, false);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS buyback_kpi ON public."Buyback_Requests";
+CREATE TRIGGER buyback_kpi
+    AFTER INSERT OR DELETE OR UPDATE OF status, manager_id, offer_price, desired_price
+    ON public."Buyback_Requests"
+    FOR EACH ROW EXECUTE FUNCTION public.trg_buyback_kpi();
+
+-- Inspections: лічильник інспекцій інспектора за день
+CREATE OR REPLACE FUNCTION public.trg_inspection_kpi() RETURNS trigger
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = public, pg_temp AS $$
+BEGIN
+    -- Інспекція без інспектора/дати нікому не зараховується (manager_id і day - NOT NULL)
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.inspector_id IS NOT NULL AND OLD.inspection_date IS NOT NULL THEN
+        PERFORM public.kpi_bump(OLD.inspector_id, OLD.inspection_date::date, -1, false, NULL, NULL, true);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.inspector_id IS NOT NULL AND NEW.inspection_date IS NOT NULL THEN
+        PERFORM public.kpi_bump(NEW.inspector_id, NEW.inspection_date::date, 1, false, NULL, NULL, true);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS inspection_kpi ON public."Inspections";
+CREATE TRIGGER inspection_kpi
+    AFTER INSERT OR DELETE OR UPDATE OF inspector_id, inspection_date
+    ON public."Inspections"
+    FOR EACH ROW EXECUTE FUNCTION public.trg_inspection_kpi();
+
+-- Функції з правами власника: напряму їх не викликає жодна роль, лише тригери
+REVOKE EXECUTE ON FUNCTION public.kpi_bump(integer, date, integer, boolean, numeric, numeric, boolean) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.trg_buyback_completed_at() FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.trg_buyback_kpi() FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.trg_inspection_kpi() FROM PUBLIC;
+
+-- Початкове заповнення (перераховуємо з нуля)
+TRUNCATE public.manager_kpi_daily;
+
+INSERT INTO public.manager_kpi_daily
+    (manager_id, day, completed_buybacks, offer_sum, offer_count, ratio_sum, ratio_count, inspections)
+SELECT manager_id, day,
+       SUM(completed_buybacks), SUM(offer_sum), SUM(offer_count), SUM(ratio_sum), SUM(ratio_count), SUM(inspections)
+FROM (
+    SELECT manager_id, completed_at::date AS day,
+           COUNT(*) AS completed_buybacks,
+           COALESCE(SUM(offer_price), 0) AS offer_sum,
+           COUNT(offer_price) AS offer_count,
+           COALESCE(SUM(offer_price / desired_price) FILTER (WHERE desired_price > 0), 0) AS ratio_sum,
+           COUNT(offer_price) FILTER (WHERE desired_price > 0) AS ratio_count,
+           0 AS inspections
+    FROM public."Buyback_Requests"
+    WHERE status = 'completed' AND manager_id IS NOT NULL AND completed_at IS NOT NULL
+    GROUP BY manager_id, completed_at::date
+
+    UNION ALL
+
+    SELECT inspector_id, inspection_date::date, 0, 0, 0, 0, 0, COUNT(*)
+    FROM public."Inspections"
+    WHERE inspector_id IS NOT NULL AND inspection_date IS NOT NULL
+    GROUP BY inspector_id, inspection_date::date
+) s
+GROUP BY manager_id, day;
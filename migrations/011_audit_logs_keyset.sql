@@ -0,0 +1,11 @@
+-- Індекси під перегляд протоколу (pages/Audit_Logs.py):
+-- keyset-пагінація ORDER BY timestamp DESC, log_id DESC, фільтр за користувачем і підрахунок за типами дій.
+
+CREATE INDEX IF NOT EXISTS idx_audit_logs_ts_id
+    ON public."Audit_Logs" ("timestamp" DESC, log_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_audit_logs_user_ts_id
+    ON public."Audit_Logs" (user_id, "timestamp" DESC, log_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_audit_logs_action_ts
+    ON public."Audit_Logs" (action_type, "timestamp");
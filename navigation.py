@@ -1,9 +1,34 @@
 import streamlit as st
-from time import sleep
+
+FLASH_KEY = '_flash'
+FLASH_ICONS = {"success": "✅", "warning": "⚠️", "error": "⛔", "info": "ℹ️"}
+
+
+def queue_flash(message, kind="success", balloons=False):
+    """Ставить повідомлення в чергу - його покаже show_flash() на наступному рендері."""
+    st.session_state.setdefault(FLASH_KEY, []).append((kind, message, balloons))
+
+
+def show_flash():
+    """Показує (тостом) і очищає накопичені повідомлення."""
+    for kind, message, balloons in st.session_state.pop(FLASH_KEY, []):
+        st.toast(message, icon=FLASH_ICONS.get(kind))
+        if balloons:
+            st.balloons()
+
+
+def post_action(message, kind="success", balloons=False):
+    """
+    Завершення дії після запису в БД: повідомлення в чергу і одразу перезапуск сторінки
+    (замість st.success + time.sleep + st.rerun, які тримали потік сервера).
+    """
+    queue_flash(message, kind, balloons)
+    st.rerun()
 
 
 def make_sidebar():
     """Малює бічну панель навігації залежно від ролі."""
+    show_flash()
 
     # Якщо стилі не підвантажились або юзер не залогінений - нічого не малюємо
     if 'role' not in st.session_state or st.session_state['role'] is None:
@@ -57,6 +82,6 @@ def make_sidebar():
             st.session_state['user_id'] = None
             st.session_state['role'] = None
             st.session_state['username'] = None
-            st.success("Вихід...")
-            sleep(0.5)
+            st.session_state['employee_id'] = None
+            queue_flash("Ви вийшли з системи.", "info")
             st.switch_page("main.py")
\ No newline at end of file
@@ -1,5 +1,8 @@
 import streamlit as st
-from db_utils import run_query, log_action
+from db_utils import log_action
+from reports import REPORT_SQL, load_reports, report_params
+from exports import export_panel
+from frame_cache import cache_stats, CACHE_BUDGET_MB
 import datetime
 import plotly.express as px
 import pandas as pd
@@ -20,35 +23,12 @@ if st.session_state['role'] != 'admin':
 make_sidebar()
 st.title("📊 Комплексна аналітика бізнесу")
 
-# --- КОНСТАНТИ ---
-COMMISSION_RATE = 0.05
-COMPANY_EMAIL = 'company@marketplace.com'
-
-
 # --- ФУНКЦІЯ ЕКСПОРТУ (Щоб не дублювати код) ---
-def render_export_buttons(df, filename_prefix):
+def render_export_buttons(report_name, filename_prefix, total=None):
+    """Файл формується у фоні лише на запит (exports.py), а не на кожному перезапуску сторінки."""
     st.subheader("📥 Експорт звіту")
-    col1, col2 = st.columns(2)
-
-    with col1:
-        csv = df.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            label="Завантажити CSV",
-            data=csv,
-            file_name=f"{filename_prefix}.csv",
-            mime="text/csv",
-            key=f"csv_{filename_prefix}"
-        )
-
-    with col2:
-        json_str = df.to_json(orient="records", date_format="iso")
-        st.download_button(
-            label="Завантажити JSON",
-            data=json_str,
-            file_name=f"{filename_prefix}.json",
-            mime="application/json",
-            key=f"json_{filename_prefix}"
-        )
+    export_panel(filename_prefix, REPORT_SQL[report_name], report_params(start_date, end_date),
+                 filename_prefix, total=total)
 
 
 # --- САЙДБАР ---
@@ -71,6 +51,15 @@ if 'analytics_logged' not in st.session_state:
     log_action(st.session_state['user_id'], "VIEW", "Analytics", None, f"Перегляд звіту {start_date}-{end_date}")
     st.session_state['analytics_logged'] = True
 
+# --- ЗАПИТИ ЗВІТІВ ---
+# SQL і кеш - у reports.py; всі вкладки рендеряться одразу, тому запити виконуються паралельно
+reports, report_errors = load_reports(['finance', 'brands', 'managers'], start_date, end_date)
+
+for report_name, err in report_errors.items():
+    st.error(f"Помилка звіту '{report_name}': {err}")
+
+df_fin, df_brands, df_managers = reports['finance'], reports['brands'], reports['managers']
+
 # --- ВКЛАДКИ ---
 tab1, tab2, tab3 = st.tabs(["💰 Фінанси & Операції", "🚗 Популярність Авто", "👥 Ефективність Менеджерів"])
 
@@ -80,43 +69,7 @@ tab1, tab2, tab3 = st.tabs(["💰 Фінанси & Операції", "🚗 По
 with tab1:
     st.header("💰 Фінанси та Операції")
 
-    finance_query = f"""
-        WITH DealDetails AS (
-            SELECT
-                d.deal_id, d.final_price, d.deal_date, sa.car_id,
-                (CASE WHEN u.email = '{COMPANY_EMAIL}' THEN true ELSE false END) AS is_company_deal
-            FROM public."Deals" d
-            JOIN public."Sale_Announcements" sa ON d.announcement_id = sa.announcement_id
-            JOIN public."Users" u ON sa.seller_user_id = u.user_id
-            WHERE d.deal_date BETWEEN '{start_date}' AND '{end_date}'
-        ),
-        LatestBuybackCosts AS (
-            SELECT car_id, COALESCE(offer_price, desired_price) AS cost_price
-            FROM (
-                SELECT car_id, offer_price, desired_price,
-                       ROW_NUMBER() OVER(PARTITION BY car_id ORDER BY request_date DESC) as rn
-                FROM public."Buyback_Requests" 
-                WHERE status = 'completed'
-            ) AS RankedCosts
-            WHERE rn = 1
-        )
-        SELECT
-            date_trunc('month', dd.deal_date)::date AS sales_month,
-            SUM(COALESCE(CASE WHEN dd.is_company_deal THEN dd.final_price - lbc.cost_price ELSE 0 END, 0))::bigint AS resale_margin,
-            SUM(CASE WHEN NOT dd.is_company_deal THEN dd.final_price * {COMMISSION_RATE} ELSE 0 END)::bigint AS commission_revenue,
-            SUM(dd.final_price)::bigint AS total_turnover,
-            COUNT(CASE WHEN dd.is_company_deal THEN 1 END) AS count_tradein,
-            COUNT(CASE WHEN NOT dd.is_company_deal THEN 1 END) AS count_p2p,
-            COUNT(dd.deal_id) AS total_deals
-        FROM DealDetails dd
-        LEFT JOIN LatestBuybackCosts lbc ON dd.car_id = lbc.car_id
-        GROUP BY sales_month
-        ORDER BY sales_month ASC;
-    """
-    df_fin = run_query(finance_query, fetch="all")
-
     if df_fin is not None and not df_fin.empty:
-        df_fin['Net Income'] = df_fin['resale_margin'] + df_fin['commission_revenue']
         total_turnover = df_fin['total_turnover'].sum()
         total_deals_count = df_fin['total_deals'].sum()
         avg_check = total_turnover / total_deals_count if total_deals_count > 0 else 0
@@ -146,7 +99,7 @@ with tab1:
             st.plotly_chart(fig_count, use_container_width=True)
 
         # ЕКСПОРТ (TAB 1)
-        render_export_buttons(df_fin, "finance_report")
+        render_export_buttons('finance', "finance_report", total=len(df_fin))
 
     else:
         st.warning("Немає фінансових даних за цей період.")
@@ -156,17 +109,6 @@ with tab1:
 # ========================================================
 with tab2:
     st.header("Топ продажів за марками")
-    brand_query = f"""
-        SELECT b.name AS brand_name, COUNT(d.deal_id) AS deals_count, SUM(d.final_price) AS total_volume
-        FROM public."Deals" d
-        JOIN public."Sale_Announcements" sa ON d.announcement_id = sa.announcement_id
-        JOIN public."Cars" c ON sa.car_id = c.car_id
-        JOIN public."Models" m ON c.model_id = m.model_id
-        JOIN public."Brands" b ON m.brand_id = b.brand_id
-        WHERE d.deal_date BETWEEN '{start_date}' AND '{end_date}'
-        GROUP BY b.name ORDER BY deals_count DESC LIMIT 10;
-    """
-    df_brands = run_query(brand_query, fetch="all")
 
     if df_brands is not None and not df_brands.empty:
         c1, c2 = st.columns([1, 2])
@@ -177,7 +119,7 @@ with tab2:
             st.plotly_chart(fig_pie, use_container_width=True)
 
         # ЕКСПОРТ (TAB 2)
-        render_export_buttons(df_brands, "brands_report")
+        render_export_buttons('brands', "brands_report", total=len(df_brands))
     else:
         st.info("Недостатньо даних.")
 
@@ -186,16 +128,6 @@ with tab2:
 # ========================================================
 with tab3:
     st.header("KPI Менеджерів")
-    manager_query = f"""
-        SELECT e.first_name || ' ' || e.last_name AS manager_name,
-            COUNT(br.request_id) AS completed_buybacks,
-            AVG(br.offer_price)::numeric(10,2) AS avg_buy_price
-        FROM public."Buyback_Requests" br
-        JOIN public."Employees" e ON br.manager_id = e.employee_id
-        WHERE br.status = 'completed'
-        GROUP BY manager_name ORDER BY completed_buybacks DESC;
-    """
-    df_managers = run_query(manager_query, fetch="all")
 
     if df_managers is not None and not df_managers.empty:
         fig_mgr = px.bar(
@@ -204,7 +136,29 @@ with tab3:
         )
         st.plotly_chart(fig_mgr, use_container_width=True)
 
+        st.dataframe(
+            df_managers, use_container_width=True, hide_index=True,
+            column_config={
+                "manager_name": "Менеджер",
+                "completed_buybacks": "Завершено викупів",
+                "avg_buy_price": st.column_config.NumberColumn("Сер. ціна викупу", format="$%.2f"),
+                "offer_to_desired": st.column_config.NumberColumn("Пропозиція / бажана", format="%.3f"),
+                "inspections": "Інспекцій",
+            }
+        )
+
         # ЕКСПОРТ (TAB 3)
-        render_export_buttons(df_managers, "managers_kpi")
+        render_export_buttons('managers', "managers_kpi", total=len(df_managers))
+    else:
+        st.info("Немає даних.")
+
+# ========================================================
+# ПАМ'ЯТЬ КЕШІВ ДАНИХ (frame_cache)
+# ========================================================
+with st.expander("🧠 Кеші даних сторінок"):
+    stats = cache_stats()
+    if stats.empty:
+        st.caption("Кеші ще не заповнені.")
     else:
-        st.info("Немає даних.")
\ No newline at end of file
+        st.metric("Зайнято пам'яті", f"{stats['size_mb'].sum():.1f} / {CACHE_BUDGET_MB} MB")
+        st.dataframe(stats, use_container_width=True, hide_index=True)
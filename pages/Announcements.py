@@ -1,8 +1,11 @@
 import streamlit as st
 from db_utils import run_query, log_action, get_db_connection
-from navigation import make_sidebar
+from navigation import make_sidebar, post_action
+from frame_cache import frame_cache, clear_caches
+from frame_filter import filter_frame
+from catalog import search_clause, spec_clause
+from facets import load_facets, brand_counts, model_counts, facet_range, open_bound
 import pandas as pd
-import time
 
 st.set_page_config(page_title="Оголошення", layout="wide")
 
@@ -19,12 +22,13 @@ st.title("📢 Вітрина оголошень")
 
 
 # --- ЗАВАНТАЖЕННЯ ДАНИХ ---
-@st.cache_data
+@frame_cache()
 def load_data():
     # 1. Оголошення
     query = """
     SELECT 
         sa.announcement_id,
+        sa.car_id,
         b.name AS brand,
         m.name AS model,
         c.year,
@@ -43,7 +47,8 @@ def load_data():
     WHERE sa.status = 'active'
     ORDER BY sa.creation_date DESC;
     """
-    df = run_query(query, fetch="all")
+    # Найбільша вибірка сторінки: COPY -> Arrow замість поступового створення DataFrame з кортежів
+    df = run_query(query, fetch="arrow_df")
 
     # 2. Довідник характеристик
     chars_ref = run_query('SELECT characteristic_id, name FROM public."Characteristics" ORDER BY name;', fetch="all")
@@ -51,6 +56,72 @@ def load_data():
     return df, chars_ref
 
 
+@st.cache_data
+def load_page_characteristics(car_ids):
+    """
+    Одним запитом тягне характеристики для всіх авто видимої сторінки.
+    Повертає словник {car_id: DataFrame(characteristic_id, name, value)}.
+    """
+    if not car_ids:
+        return {}
+
+    chars = run_query("""
+        SELECT cc.car_id, cc.characteristic_id, ch.name, cc.value
+        FROM "Car_Characteristics" cc
+        JOIN "Characteristics" ch ON cc.characteristic_id = ch.characteristic_id
+        WHERE cc.car_id = ANY(%s)
+        ORDER BY cc.car_id, ch.name
+    """, (list(car_ids),), fetch="all")
+
+    if chars is None or chars.empty:
+        return {}
+
+    return {int(cid): grp.drop(columns='car_id').reset_index(drop=True) for cid, grp in chars.groupby('car_id')}
+
+
+@st.cache_data
+def search_listing_ids(search):
+    """Повнотекстовий пошук у БД. Повертає ID активних оголошень у порядку релевантності."""
+    condition, cond_params, rank, rank_params = search_clause(search)
+    res = run_query(f"""
+        SELECT sa.announcement_id
+        FROM public."Sale_Announcements" sa
+        JOIN public."Cars" c ON sa.car_id = c.car_id
+        JOIN public."Models" m ON c.model_id = m.model_id
+        JOIN public."Brands" b ON m.brand_id = b.brand_id
+        WHERE sa.status = 'active' AND {condition}
+        ORDER BY {rank} DESC, sa.creation_date DESC;
+    """, tuple(cond_params + rank_params), fetch="all")
+    return res['announcement_id'].tolist() if res is not None else []
+
+
+@st.cache_data
+def load_spec_options():
+    """Значення характеристик серед активних оголошень (з JSONB-проекції Cars.specs)."""
+    return run_query("""
+        SELECT s.key AS name, s.value, COUNT(*) AS cnt
+        FROM public."Sale_Announcements" sa
+        JOIN public."Cars" c ON sa.car_id = c.car_id
+        CROSS JOIN LATERAL jsonb_each_text(c.specs) s
+        WHERE sa.status = 'active'
+        GROUP BY s.key, s.value
+        ORDER BY s.key, cnt DESC;
+    """, fetch="all")
+
+
+@st.cache_data
+def spec_listing_ids(spec_items):
+    """ID активних оголошень, авто яких має всі обрані характеристики (GIN-індекс по Cars.specs)."""
+    condition, cond_params = spec_clause(dict(spec_items))
+    res = run_query(f"""
+        SELECT sa.announcement_id
+        FROM public."Sale_Announcements" sa
+        JOIN public."Cars" c ON sa.car_id = c.car_id
+        WHERE sa.status = 'active' AND {condition};
+    """, tuple(cond_params), fetch="all")
+    return res['announcement_id'].tolist() if res is not None else []
+
+
 df, chars_ref_df = load_data()
 
 if df is None:
@@ -75,179 +146,187 @@ elif user_role in ['manager', 'admin']:
         df = df[df['seller_user_id'] == comp_id]
 
 # === ІНШІ ФІЛЬТРИ ===
-search_q = st.sidebar.text_input("🔍 Пошук (Опис):", key="search_q")
+search_q = st.sidebar.text_input("🔍 Пошук (Марка, модель, опис):", key="search_q")
 
-# 1. Бренд
-all_brands = sorted(df['brand'].unique()) if not df.empty else []
-brand_filter = st.sidebar.multiselect("Марка:", options=all_brands, key="brand_filter")
+# Опції фільтрів беремо з агрегатів (facet_summary), а не з усього датасету
+facets = load_facets('listings')
 
-# 2. Модель (Залежний фільтр)
-if brand_filter:
-    # Якщо обрали марку - показуємо тільки її моделі
-    available_models = sorted(df[df['brand'].isin(brand_filter)]['model'].unique())
-else:
-    # Інакше всі моделі
-    available_models = sorted(df['model'].unique()) if not df.empty else []
+# 1. Бренд
+brand_cnt = brand_counts(facets)
+brand_filter = st.sidebar.multiselect("Марка:", options=list(brand_cnt.index), key="brand_filter",
+                                      format_func=lambda b: f"{b} ({brand_cnt[b]})")
 
-model_filter = st.sidebar.multiselect("Модель:", options=available_models, key="model_filter")
+# 2. Модель (Залежний фільтр: кількість рахується з урахуванням обраних марок)
+model_cnt = model_counts(facets, brand_filter)
+model_filter = st.sidebar.multiselect("Модель:", options=list(model_cnt.index), key="model_filter",
+                                      format_func=lambda m: f"{m} ({model_cnt.get(m, 0)})")
 
 # 3. Ціна
-if not df.empty:
-    min_p_db = int(df['price'].min())
-    max_p_db = int(df['price'].max())
-else:
-    min_p_db, max_p_db = 0, 100000
+min_p_db, max_p_db = facet_range(facets, 'price', brand_filter, model_filter)
 
 c_p1, c_p2 = st.sidebar.columns(2)
 p_from = c_p1.number_input("Від ($)", min_value=0, value=min_p_db, step=500, key="price_from")
 p_to = c_p2.number_input("До ($)", min_value=0, value=max_p_db, step=500, key="price_to")
 
+# 4. Характеристики (Паливо, Коробка, ...)
+spec_filter = {}
+spec_opts = load_spec_options()
+if spec_opts is not None and not spec_opts.empty:
+    with st.sidebar.expander("⚙️ Характеристики"):
+        for spec_name, grp in spec_opts.groupby('name', sort=True):
+            choice = st.selectbox(spec_name, options=["Всі"] + grp['value'].tolist(), key=f"spec_{spec_name}")
+            if choice != "Всі":
+                spec_filter[spec_name] = choice
+
 # --- ЗАСТОСУВАННЯ ФІЛЬТРІВ ---
-filtered_df = df.copy()
+# Текстовий пошук і характеристики відбирає Postgres (GIN-індекси), решта - спільний рушій фільтрів
+# Характеристики і пошук дають списки id - перетинаємо їх і фільтруємо все одним викликом
+ann_ids = None
+if spec_filter:
+    ann_ids = set(spec_listing_ids(tuple(sorted(spec_filter.items()))))
 
 if search_q:
-    mask = (
-            filtered_df['brand'].str.contains(search_q, case=False) |
-            filtered_df['model'].str.contains(search_q, case=False) |
-            filtered_df['description'].str.contains(search_q, case=False)
-    )
-    filtered_df = filtered_df[mask]
+    # Тут лише зберігаємо порядок релевантності
+    found_ids = search_listing_ids(search_q.strip())
+    rank_map = {ann_id: pos for pos, ann_id in enumerate(found_ids)}
+    ann_ids = set(found_ids) if ann_ids is None else ann_ids & set(found_ids)
+
+isin = {'brand': brand_filter, 'model': model_filter}
+if ann_ids is not None:
+    isin['announcement_id'] = sorted(ann_ids) or [-1]
+filtered_df = filter_frame(df, isin=isin, ranges={'price': (open_bound(p_from, min_p_db), open_bound(p_to, max_p_db))})
 
-if brand_filter:
-    filtered_df = filtered_df[filtered_df['brand'].isin(brand_filter)]
+if search_q:
+    filtered_df = filtered_df.iloc[filtered_df['announcement_id'].map(rank_map).argsort()]
 
-if model_filter:
-    filtered_df = filtered_df[filtered_df['model'].isin(model_filter)]
+# --- ПАГІНАЦІЯ ---
+PAGE_SIZE = 50
+total_pages = max(1, (len(filtered_df) + PAGE_SIZE - 1) // PAGE_SIZE)
+page = st.sidebar.number_input("Сторінка:", min_value=1, max_value=total_pages, value=1, step=1, key="ann_page")
+page_df = filtered_df.iloc[(page - 1) * PAGE_SIZE: page * PAGE_SIZE]
 
-filtered_df = filtered_df[(filtered_df['price'] >= p_from) & (filtered_df['price'] <= p_to)]
+# Характеристики всієї сторінки одним запитом (вибір рядка більше не ходить у БД)
+page_chars = load_page_characteristics(tuple(int(x) for x in page_df['car_id']))
 
 # --- ВІДОБРАЖЕННЯ ---
-st.info("👇 Натисніть на рядок у таблиці, щоб побачити деталі.")
-display_cols = ['brand', 'model', 'year', 'mileage', 'price', 'description']
-
-event = st.dataframe(
-    filtered_df[display_cols],
-    use_container_width=True,
-    hide_index=True,
-    on_select="rerun",
-    selection_mode="single-row"
-)
-
-st.divider()
-
-# --- ОТРИМАННЯ ВИБРАНОГО ID ---
-sel_ann_id = None
-if len(event.selection.rows) > 0:
-    selected_index = event.selection.rows[0]
-    sel_ann_id = filtered_df.iloc[selected_index]['announcement_id']
-
-# --- ДЕТАЛІ ---
-if sel_ann_id:
-    car_id = \
-    run_query('SELECT car_id FROM "Sale_Announcements" WHERE announcement_id=%s', (int(sel_ann_id),), fetch="one")[0]
-    curr_ann = filtered_df[filtered_df['announcement_id'] == sel_ann_id].iloc[0]
-
-    c1, c2 = st.columns([1, 1])
-
-    with c1:
-        st.subheader("ℹ️ Деталі авто")
-        chars = run_query("""
-            SELECT ch.name, cc.value 
-            FROM "Car_Characteristics" cc
-            JOIN "Characteristics" ch ON cc.characteristic_id = ch.characteristic_id
-            WHERE cc.car_id = %s
-        """, (car_id,), fetch="all")
-
-        if chars is not None and not chars.empty:
-            st.table(chars)
-        else:
-            st.info("Характеристики не вказані.")
-
-    with c2:
-        st.subheader("🛠️ Управління / Контакти")
-        st.success(f"Обрано: **{curr_ann['brand']} {curr_ann['model']}**")
-
-        is_owner = curr_ann['seller_user_id'] == st.session_state['user_id']
-        is_staff = user_role in ['manager', 'admin']
-
-        if is_owner or is_staff:
-            actions = ["Редагувати ціну/опис", "Архівувати (Зняти з продажу)"]
-            if is_staff:
-                actions.append("🛠️ Редагувати Характеристики (Модерація)")
-
-            action = st.radio("Дія:", actions, key=f"act_{sel_ann_id}")
-
-            # 1. UPDATE
-            if action == "Редагувати ціну/опис":
-                with st.form(f"edit_{sel_ann_id}"):
-                    np = st.number_input("Ціна:", value=float(curr_ann['price']))
-                    nd = st.text_area("Опис:", value=curr_ann['description'])
-                    if st.form_submit_button("Зберегти"):
-                        run_query('UPDATE "Sale_Announcements" SET price=%s, description=%s WHERE announcement_id=%s',
-                                  (np, nd, int(sel_ann_id)), commit=True)
-                        log_action(st.session_state['user_id'], "UPDATE", "Sale_Announcements", int(sel_ann_id),
-                                   f"Change Price: {np}")
-                        st.cache_data.clear()
-                        st.success("Оновлено!")
-                        time.sleep(1)
-                        st.rerun()
-
-            # 2. ARCHIVE
-            elif action == "Архівувати (Зняти з продажу)":
-                if st.button("Підтвердити архівування", key=f"arch_{sel_ann_id}"):
-                    run_query("UPDATE \"Sale_Announcements\" SET status='inactive' WHERE announcement_id=%s",
-                              (int(sel_ann_id),), commit=True)
-                    log_action(st.session_state['user_id'], "ARCHIVE", "Sale_Announcements", int(sel_ann_id),
-                               "Archived")
-                    st.cache_data.clear()
-                    st.success("В архіві!")
-                    time.sleep(1)
-                    st.rerun()
-
-            # 3. MODERATE
-            elif action == "🛠️ Редагувати Характеристики (Модерація)":
-                curr_chars_q = run_query('SELECT characteristic_id, value FROM "Car_Characteristics" WHERE car_id=%s',
-                                         (car_id,), fetch="all")
-                curr_dict = dict(
-                    zip(curr_chars_q['characteristic_id'], curr_chars_q['value'])) if curr_chars_q is not None else {}
-
-                with st.form(f"mod_{sel_ann_id}"):
-                    new_vals = {}
-                    if chars_ref_df is not None:
-                        for _, row in chars_ref_df.iterrows():
-                            cid, cname = row['characteristic_id'], row['name']
-                            val = st.text_input(cname, value=curr_dict.get(cid, ""))
-                            new_vals[cid] = val
-
-                    if st.form_submit_button("Зберегти характеристики"):
-                        try:
-                            with get_db_connection() as conn:
-                                with conn.cursor() as cur:
-                                    for cid, val in new_vals.items():
-                                        if val:
-                                            cur.execute("""INSERT INTO "Car_Characteristics" (car_id, characteristic_id, value) VALUES (%s, %s, %s) 
-                                                           ON CONFLICT (car_id, characteristic_id) DO UPDATE SET value=EXCLUDED.value""",
-                                                        (car_id, cid, val))
-                                        elif cid in curr_dict:
-                                            cur.execute(
-                                                'DELETE FROM "Car_Characteristics" WHERE car_id=%s AND characteristic_id=%s',
-                                                (car_id, cid))
-                                    conn.commit()
-                            log_action(st.session_state['user_id'], "MODERATE", "Car_Characteristics", int(car_id),
-                                       "Updated specs")
-                            st.cache_data.clear()
-                            st.success("Збережено!")
-                            time.sleep(1)
-                            st.rerun()
-                        except Exception as e:
-                            st.error(f"Error: {e}")
-
-        else:
-            owner_email = curr_ann['owner_email']
-            owner_phone = curr_ann['owner_phone'] if curr_ann['owner_phone'] else "Не вказано"
-            st.info("Контакти продавця:")
-            st.markdown(f"📧 <a href='mailto:{owner_email}'>{owner_email}</a>", unsafe_allow_html=True)
-            st.markdown(f"📞 <a href='tel:{owner_phone}'>{owner_phone}</a>", unsafe_allow_html=True)
-
-else:
-    st.info("👈 Оберіть автомобіль у таблиці вище.")
\ No newline at end of file
+# Таблиця + деталі живуть у фрагменті: вибір рядка чи зміна дії не перераховує фільтри та сайдбар
+@st.fragment
+def listing_panel(page_df, page_chars):
+    st.info("👇 Натисніть на рядок у таблиці, щоб побачити деталі.")
+    display_cols = ['brand', 'model', 'year', 'mileage', 'price', 'description']
+
+    event = st.dataframe(
+        page_df[display_cols],
+        use_container_width=True,
+        hide_index=True,
+        on_select="rerun",
+        selection_mode="single-row"
+    )
+
+    st.divider()
+
+    # --- ОТРИМАННЯ ВИБРАНОГО ID ---
+    sel_ann_id = None
+    if len(event.selection.rows) > 0:
+        selected_index = event.selection.rows[0]
+        sel_ann_id = page_df.iloc[selected_index]['announcement_id']
+
+    # --- ДЕТАЛІ ---
+    if sel_ann_id:
+        curr_ann = page_df[page_df['announcement_id'] == sel_ann_id].iloc[0]
+        car_id = int(curr_ann['car_id'])
+        car_chars = page_chars.get(car_id)
+
+        c1, c2 = st.columns([1, 1])
+
+        with c1:
+            st.subheader("ℹ️ Деталі авто")
+            if car_chars is not None and not car_chars.empty:
+                st.table(car_chars[['name', 'value']])
+            else:
+                st.info("Характеристики не вказані.")
+
+        with c2:
+            st.subheader("🛠️ Управління / Контакти")
+            st.success(f"Обрано: **{curr_ann['brand']} {curr_ann['model']}**")
+
+            is_owner = curr_ann['seller_user_id'] == st.session_state['user_id']
+            is_staff = user_role in ['manager', 'admin']
+
+            if is_owner or is_staff:
+                actions = ["Редагувати ціну/опис", "Архівувати (Зняти з продажу)"]
+                if is_staff:
+                    actions.append("🛠️ Редагувати Характеристики (Модерація)")
+
+                action = st.radio("Дія:", actions, key=f"act_{sel_ann_id}")
+
+                # 1. UPDATE
+                if action == "Редагувати ціну/опис":
+                    with st.form(f"edit_{sel_ann_id}"):
+                        np = st.number_input("Ціна:", value=float(curr_ann['price']))
+                        nd = st.text_area("Опис:", value=curr_ann['description'])
+                        if st.form_submit_button("Зберегти"):
+                            run_query('UPDATE "Sale_Announcements" SET price=%s, description=%s WHERE announcement_id=%s',
+                                      (np, nd, int(sel_ann_id)), commit=True)
+                            log_action(st.session_state['user_id'], "UPDATE", "Sale_Announcements", int(sel_ann_id),
+                                       f"Change Price: {np}")
+                            clear_caches()
+                            post_action("Оновлено!")
+
+                # 2. ARCHIVE
+                elif action == "Архівувати (Зняти з продажу)":
+                    if st.button("Підтвердити архівування", key=f"arch_{sel_ann_id}"):
+                        run_query("UPDATE \"Sale_Announcements\" SET status='inactive' WHERE announcement_id=%s",
+                                  (int(sel_ann_id),), commit=True)
+                        log_action(st.session_state['user_id'], "ARCHIVE", "Sale_Announcements", int(sel_ann_id),
+                                   "Archived")
+                        clear_caches()
+                        post_action("В архіві!")
+
+                # 3. MODERATE
+                elif action == "🛠️ Редагувати Характеристики (Модерація)":
+                    curr_dict = dict(
+                        zip(car_chars['characteristic_id'], car_chars['value'])) if car_chars is not None else {}
+
+                    with st.form(f"mod_{sel_ann_id}"):
+                        new_vals = {}
+                        if chars_ref_df is not None:
+                            for _, row in chars_ref_df.iterrows():
+                                cid, cname = row['characteristic_id'], row['name']
+                                val = st.text_input(cname, value=curr_dict.get(cid, ""))
+                                new_vals[cid] = val
+
+                        if st.form_submit_button("Зберегти характеристики"):
+                            try:
+                                with get_db_connection() as conn:
+                                    with conn.cursor() as cur:
+                                        for cid, val in new_vals.items():
+                                            if val:
+                                                cur.execute("""INSERT INTO "Car_Characteristics" (car_id, characteristic_id, value) VALUES (%s, %s, %s) 
+                                                               ON CONFLICT (car_id, characteristic_id) DO UPDATE SET value=EXCLUDED.value""",
+                                                            (car_id, cid, val))
+                                            elif cid in curr_dict:
+                                                cur.execute(
+                                                    'DELETE FROM "Car_Characteristics" WHERE car_id=%s AND characteristic_id=%s',
+                                                    (car_id, cid))
+                                        conn.commit()
+                                log_action(st.session_state['user_id'], "MODERATE", "Car_Characteristics", int(car_id),
+                                           "Updated specs")
+                                clear_caches()
+                                post_action("Збережено!")
+                            except Exception as e:
+                                st.error(f"Error: {e}")
+
+            else:
+                owner_email = curr_ann['owner_email']
+                owner_phone = curr_ann['owner_phone'] if curr_ann['owner_phone'] else "Не вказано"
+                st.info("Контакти продавця:")
+                st.markdown(f"📧 <a href='mailto:{owner_email}'>{owner_email}</a>", unsafe_allow_html=True)
+                st.markdown(f"📞 <a href='tel:{owner_phone}'>{owner_phone}</a>", unsafe_allow_html=True)
+
+    else:
+        st.info("👈 Оберіть автомобіль у таблиці вище.")
+
+
+st.caption(f"Знайдено оголошень: {len(filtered_df)} | Сторінка {page} з {total_pages}")
+listing_panel(page_df, page_chars)
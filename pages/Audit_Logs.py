@@ -1,8 +1,13 @@
 import streamlit as st
-from db_utils import run_query
-from navigation import make_sidebar
+from db_utils import run_query, log_action
+from navigation import make_sidebar, post_action
+from audit_archive import (HOT_MONTHS, archive_action_counts, archive_closed_months, archived_months,
+                           can_read_archive, iter_archive_rows, next_month, query_archive_page)
+from exports import export_panel
+from catalog import like_prefix
 import pandas as pd
 import datetime
+import functools
 
 st.set_page_config(page_title="Протокол дій", layout="wide")
 
@@ -32,10 +37,42 @@ action_types = ["Всі", "LOGIN", "REGISTER", "INSERT", "UPDATE", "DELETE", "TR
                 "EXTERNAL_LEAD"]
 selected_action = st.sidebar.selectbox("Тип дії:", action_types)
 
-search_user = st.sidebar.text_input("Пошук (ID або Email):")
+search_user = st.sidebar.text_input("Пошук (ID або початок Email):")
 
 # --- ЗАВАНТАЖЕННЯ ---
-base_query = """
+AUDIT_PAGE_SIZE = 100
+
+
+def resolve_user_ids(search):
+    """
+    Спочатку знаходимо користувачів (ID або префікс email по індексу),
+    а потім фільтруємо Audit_Logs.user_id - без ILIKE по всьому протоколу.
+    """
+    if search.isdigit():
+        return [int(search)]
+    # Без LIMIT (на відміну від підказок widgets.search_users): розслідуванню потрібні всі збіги
+    users = run_query('SELECT user_id FROM public."Users" WHERE lower(email) LIKE %s;',
+                      (like_prefix(search.lower()),), fetch="all")
+    return [] if users is None else [int(uid) for uid in users['user_id']]
+
+
+def audit_where(filters):
+    """Фільтри -> (WHERE, параметри). filters = (start, end, action, user_ids)."""
+    start, end, action, user_ids = filters
+    conds = ['al."timestamp" >= %s', 'al."timestamp" < %s']
+    params = [start, end]
+    if action is not None:
+        conds.append("al.action_type = %s")
+        params.append(action)
+    if user_ids is not None:
+        conds.append("al.user_id = ANY(%s)")
+        params.append(list(user_ids))
+    return " WHERE " + " AND ".join(conds), params
+
+
+AUDIT_COLUMNS = ["log_id", "timestamp", "user_email", "role", "action_type", "table_name", "record_id", "details"]
+
+AUDIT_SELECT = """
     SELECT 
         al.log_id,
         al.timestamp,
@@ -47,26 +84,97 @@ base_query = """
         al.details
     FROM public."Audit_Logs" al
     LEFT JOIN public."Users" u ON al.user_id = u.user_id
-    WHERE al.timestamp BETWEEN %s AND %s
 """
-params = [start_date, end_date + datetime.timedelta(days=1)]
 
-if selected_action != "Всі":
-    base_query += " AND al.action_type = %s"
-    params.append(selected_action)
 
-if search_user:
-    base_query += " AND (u.email ILIKE %s OR CAST(al.user_id AS TEXT) = %s)"
-    params.append(f"%{search_user}%")
-    params.append(search_user)
-
-base_query += " ORDER BY al.timestamp DESC LIMIT 500;"
-
-logs_df = run_query(base_query, tuple(params), fetch="all")
+def load_audit_page(filters, cursor=None):
+    """
+    Одна сторінка протоколу (keyset по (timestamp, log_id)).
+    Повертає (DataFrame сторінки, cursor для наступної сторінки або None).
+    """
+    where, params = audit_where(filters)
+    if cursor is not None:
+        where += ' AND (al."timestamp", al.log_id) < (%s, %s)'
+        params += list(cursor)
+
+    query = f'{AUDIT_SELECT} {where} ORDER BY al."timestamp" DESC, al.log_id DESC LIMIT %s;'
+    df = run_query(query, tuple(params + [AUDIT_PAGE_SIZE + 1]), fetch="all")
+    if df is None:
+        return None, None
+
+    # Гарячу таблицю вичерпано - дочитуємо з архіву (там лише старші місяці, тож keyset той самий)
+    if len(df) <= AUDIT_PAGE_SIZE:
+        archive_cursor = (df.iloc[-1]['timestamp'], int(df.iloc[-1]['log_id'])) if not df.empty else cursor
+        archived = query_archive_page(filters, archive_cursor, limit=AUDIT_PAGE_SIZE + 1 - len(df))
+        if archived is not None and not archived.empty:
+            df = pd.concat([df, archived], ignore_index=True) if not df.empty else archived
+
+    next_cursor = None
+    if len(df) > AUDIT_PAGE_SIZE:
+        df = df.iloc[:AUDIT_PAGE_SIZE]
+        last = df.iloc[-1]
+        next_cursor = (last['timestamp'], int(last['log_id']))
+    return df, next_cursor
+
+
+def load_action_counts(filters):
+    """Кількість записів за типами дій для періоду і користувача (без фільтра за типом)."""
+    range_filters = (filters[0], filters[1], None, filters[3])
+    where, params = audit_where(range_filters)
+    counts = run_query(f"""
+        SELECT al.action_type, COUNT(*) AS cnt
+        FROM public."Audit_Logs" al
+        {where}
+        GROUP BY al.action_type
+        ORDER BY cnt DESC;
+    """, tuple(params), fetch="all")
+
+    archived = archive_action_counts(range_filters)
+    if counts is None or archived is None or archived.empty:
+        return counts
+    return (pd.concat([counts, archived]).groupby('action_type', as_index=False)['cnt'].sum()
+            .sort_values('cnt', ascending=False))
+
+
+user_ids = None
+if search_user.strip():
+    user_ids = resolve_user_ids(search_user.strip())
+    if not user_ids:
+        st.warning("Користувачів за цим запитом не знайдено.")
+        st.stop()
+    st.sidebar.caption(f"Знайдено користувачів: {len(user_ids)}")
+
+filters = (start_date, end_date + datetime.timedelta(days=1),
+           None if selected_action == "Всі" else selected_action,
+           None if user_ids is None else tuple(user_ids))
+
+# Стек курсорів сторінок; при зміні фільтрів починаємо з першої сторінки
+if st.session_state.get('audit_filters') != filters:
+    st.session_state['audit_filters'] = filters
+    st.session_state['audit_cursors'] = [None]
+cursors = st.session_state['audit_cursors']
+
+logs_df, next_cursor = load_audit_page(filters, cursors[-1])
+
+# Період зачіпає заархівовані місяці, а прочитати архів нічим
+months = archived_months()
+reaches_archive = bool(months) and months[0] < filters[1] and next_month(months[-1]) > filters[0]
+if reaches_archive and not can_read_archive():
+    st.warning("Частина періоду в архіві, але пакет duckdb не встановлено - архівні записи не показано.")
+
+# --- ЗВЕДЕННЯ ЗА ТИПАМИ ДІЙ ---
+counts_df = load_action_counts(filters)
+if counts_df is not None and not counts_df.empty:
+    st.subheader("📊 Дії за період")
+    st.bar_chart(counts_df.set_index('action_type')['cnt'])
 
 # --- ВІДОБРАЖЕННЯ ---
 if logs_df is not None and not logs_df.empty:
-    st.info(f"Знайдено записів: {len(logs_df)}")
+    total = None
+    if counts_df is not None:
+        matched = counts_df if filters[2] is None else counts_df[counts_df['action_type'] == filters[2]]
+        total = int(matched['cnt'].sum())
+        st.info(f"Знайдено записів: {total}")
 
 
     def color_action(val):
@@ -88,17 +196,42 @@ if logs_df is not None and not logs_df.empty:
         use_container_width=True
     )
 
+    n1, n2, n3 = st.columns([1, 2, 1])
+    if n1.button("← Назад", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    n2.caption(f"Сторінка {len(cursors)}")
+    if n3.button("Далі →", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
+
     st.divider()
     st.subheader("📥 Експорт протоколу")
-    col1, col2 = st.columns(2)
-
-    with col1:
-        csv = logs_df.to_csv(index=False).encode('utf-8')
-        st.download_button("Завантажити CSV", data=csv, file_name="audit.csv", mime="text/csv")
-
-    with col2:
-        json_str = logs_df.to_json(orient="records", force_ascii=False, date_format="iso")
-        st.download_button("Завантажити JSON", data=json_str, file_name="audit.json", mime="application/json")
+    if reaches_archive and not can_read_archive():
+        st.warning("Експорт недоступний: період зачіпає архів, а пакет duckdb не встановлено.")
+    else:
+        where, params = audit_where(filters)
+        # Архівні рядки (старші за всі рядки БД) дописуються в кінець того ж файлу
+        tail = functools.partial(iter_archive_rows, filters, AUDIT_COLUMNS) if reaches_archive else None
+        export_panel("audit", f'{AUDIT_SELECT} {where} ORDER BY al."timestamp" DESC, al.log_id DESC',
+                     tuple(params), "audit", total=total, tail=tail)
 
 else:
-    st.warning("Записів не знайдено за обраними критеріями.")
\ No newline at end of file
+    st.warning("Записів не знайдено за обраними критеріями.")
+
+# --- АРХІВАЦІЯ ---
+st.divider()
+with st.expander("🗄️ Архів протоколу"):
+    st.write(f"Закриті місяці, старші за {HOT_MONTHS} останніх, переносяться з БД у стиснуті Parquet-файли. "
+             "Пошук у протоколі читає їх автоматично.")
+    if months:
+        st.caption(f"В архіві: {', '.join(f'{m:%Y-%m}' for m in months)}")
+    if st.button("Архівувати закриті місяці"):
+        try:
+            archived = archive_closed_months()
+            total_rows = sum(archived.values())
+            log_action(st.session_state['user_id'], "ARCHIVE", "Audit_Logs", None,
+                       f"Заархівовано {total_rows} записів ({len(archived)} міс.)")
+            post_action(f"Заархівовано {total_rows} записів за {len(archived)} міс.")
+        except Exception as e:
+            st.error(f"Помилка архівації: {e}")
\ No newline at end of file
@@ -1,9 +1,13 @@
 import streamlit as st
-from db_utils import run_query, log_action, get_db_connection
-from navigation import make_sidebar
+from db_utils import run_query, log_action, log_actions, get_db_connection, get_or_create_model
+from navigation import make_sidebar, post_action
+from frame_cache import frame_cache, clear_caches
+from frame_filter import filter_frame
+from facets import load_facets, brand_counts, model_counts
+from widgets import user_selector, car_selector
+from car_import import read_import_file, validate_import, import_cars, BASE_COLUMNS
 import pandas as pd
 import uuid
-import time
 
 st.set_page_config(page_title="База Автомобілів", layout="wide")
 
@@ -33,7 +37,7 @@ characteristics_df = load_dictionaries()
 
 
 # --- ФУНКЦІЇ ЗАВАНТАЖЕННЯ ---
-@st.cache_data
+@frame_cache()
 def load_verified_data():
     cars_query = """
     SELECT 
@@ -46,14 +50,13 @@ def load_verified_data():
     WHERE c.verification_status = 'verified'
     ORDER BY c.car_id DESC;
     """
-    cars = run_query(cars_query, fetch="all")
-    users = run_query('SELECT user_id, email FROM public."Users" ORDER BY email;', fetch="all")
+    cars = run_query(cars_query, fetch="arrow_df")
     active_ads_df = run_query("SELECT car_id FROM \"Sale_Announcements\" WHERE status = 'active'", fetch="all")
     active_ads_ids = active_ads_df['car_id'].tolist() if active_ads_df is not None else []
-    return cars, users, active_ads_ids
+    return cars, active_ads_ids
 
 
-@st.cache_data
+@frame_cache()
 def load_moderation_data():
     mod_query = """
     SELECT 
@@ -75,7 +78,7 @@ def load_moderation_data():
 # Використовуємо radio, бо воно краще тримає стан при перезавантаженні
 view_mode = st.radio(
     "Оберіть режим:",
-    ["🗂️ Загальна база (Verified)", "🛡️ Модерація (Pending & Rejected)"],
+    ["🗂️ Загальна база (Verified)", "🛡️ Модерація (Pending & Rejected)", "📦 Масова модерація (Pending)"],
     horizontal=True
 )
 
@@ -86,7 +89,7 @@ st.divider()
 # ==============================================================================
 if view_mode == "🗂️ Загальна база (Verified)":
 
-    cars_df, users_df, active_ads_ids = load_verified_data()
+    cars_df, active_ads_ids = load_verified_data()
 
     if cars_df is None:
         st.error("Помилка завантаження даних.")
@@ -99,27 +102,24 @@ if view_mode == "🗂️ Загальна база (Verified)":
     filter_no_ads = st.sidebar.checkbox("📢 Тільки БЕЗ оголошень", key="filter_no_ads")
     search_text = st.sidebar.text_input("🔍 Пошук (VIN / Email):", key="search_text")
 
-    all_brands = sorted(list(cars_df['brand'].unique())) if cars_df is not None and not cars_df.empty else []
-    brand_filter = st.sidebar.selectbox("Марка:", options=["Всі"] + all_brands, key="brand_filter")
+    facets = load_facets('cars')
+    brand_cnt = brand_counts(facets)
+    brand_filter = st.sidebar.selectbox("Марка:", options=["Всі"] + list(brand_cnt.index), key="brand_filter",
+                                        format_func=lambda b: b if b == "Всі" else f"{b} ({brand_cnt[b]})")
 
-    filtered_models = []
-    if brand_filter != "Всі" and cars_df is not None:
-        filtered_models = sorted(cars_df[cars_df['brand'] == brand_filter]['model'].unique())
-    else:
-        filtered_models = sorted(cars_df['model'].unique()) if cars_df is not None and not cars_df.empty else []
-    model_filter = st.sidebar.selectbox("Модель:", options=["Всі"] + filtered_models, key="model_filter")
+    model_cnt = model_counts(facets, [brand_filter] if brand_filter != "Всі" else None)
+    model_filter = st.sidebar.selectbox("Модель:", options=["Всі"] + list(model_cnt.index), key="model_filter",
+                                        format_func=lambda m: m if m == "Всі" else f"{m} ({model_cnt.get(m, 0)})")
 
-    filtered_df = cars_df.copy() if cars_df is not None else pd.DataFrame()
+    equals = {}
+    if filter_company: equals['owner_email'] = 'company@marketplace.com'
+    if brand_filter != "Всі": equals['brand'] = brand_filter
+    if model_filter != "Всі": equals['model'] = model_filter
 
-    if not filtered_df.empty:
-        if filter_company: filtered_df = filtered_df[filtered_df['owner_email'] == 'company@marketplace.com']
-        if filter_no_ads: filtered_df = filtered_df[~filtered_df['car_id'].isin(active_ads_ids)]
-        if search_text:
-            mask = (filtered_df['vin_code'].str.contains(search_text, case=False) |
-                    filtered_df['owner_email'].str.contains(search_text, case=False))
-            filtered_df = filtered_df[mask]
-        if brand_filter != "Всі": filtered_df = filtered_df[filtered_df['brand'] == brand_filter]
-        if model_filter != "Всі": filtered_df = filtered_df[filtered_df['model'] == model_filter]
+    filtered_df = filter_frame(
+        cars_df, search=search_text, search_cols=('vin_code', 'owner_email'), equals=equals,
+        exclude={'car_id': active_ads_ids if filter_no_ads else ()}
+    ) if cars_df is not None else pd.DataFrame()
 
     if filtered_df.empty:
         st.info("Записів не знайдено.")
@@ -170,35 +170,29 @@ if view_mode == "🗂️ Загальна база (Verified)":
 
     st.divider()
     st.subheader("🛠️ Управління базою")
-    operation = st.selectbox("Дія:", ["Додати авто (Менеджером)", "Створити оголошення", "Видалити авто"])
+    operation = st.selectbox("Дія:", ["Додати авто (Менеджером)", "Імпорт з файлу (CSV/Excel)", "Створити оголошення",
+                                      "Видалити авто"])
 
     if operation == "Додати авто (Менеджером)":
         st.write("Створене авто одразу отримає статус 'Verified'.")
+        owner = user_selector("Власник:", key="add_car_owner")
         with st.form("add_car_mgr"):
             c1, c2 = st.columns(2)
             brand = c1.text_input("Марка")
             model = c2.text_input("Модель")
-            owner = st.selectbox("Власник:", options=users_df['user_id'],
-                                 format_func=lambda x: users_df.loc[users_df['user_id'] == x, 'email'].iloc[0])
             c3, c4, c5 = st.columns(3)
             vin = c3.text_input("VIN", value=uuid.uuid4().hex[:17].upper())
             year = c4.number_input("Рік", 1900, 2025, 2020)
             mileage = c5.number_input("Пробіг", 0, 1000000, 0)
 
             if st.form_submit_button("Додати"):
+                if owner is None:
+                    st.error("Оберіть власника!")
+                    st.stop()
                 try:
                     with get_db_connection() as conn:
                         with conn.cursor() as cur:
-                            cur.execute('SELECT brand_id FROM "Brands" WHERE name=%s', (brand,))
-                            res = cur.fetchone()
-                            bid = res[0] if res else cur.execute(
-                                'INSERT INTO "Brands" (name) VALUES (%s) RETURNING brand_id', (brand,)) or \
-                                                     cur.fetchone()[0]
-                            cur.execute('SELECT model_id FROM "Models" WHERE name=%s AND brand_id=%s', (model, bid))
-                            res = cur.fetchone()
-                            mid = res[0] if res else cur.execute(
-                                'INSERT INTO "Models" (brand_id, name) VALUES (%s, %s) RETURNING model_id',
-                                (bid, model)) or cur.fetchone()[0]
+                            mid = get_or_create_model(cur, brand, model)
                             cur.execute(
                                 """INSERT INTO "Cars" (model_id, owner_id, vin_code, year, mileage, verification_status) VALUES (%s, %s, %s, %s, %s, 'verified') RETURNING car_id;""",
                                 (mid, owner, vin, year, mileage))
@@ -206,13 +200,50 @@ if view_mode == "🗂️ Загальна база (Verified)":
                         conn.commit()
                     log_action(st.session_state['user_id'], "INSERT", "Cars", new_id,
                                f"Менеджер додав авто {brand} {model}")
-                    st.cache_data.clear();
-                    st.success("Автомобіль додано!");
-                    time.sleep(1);
-                    st.rerun()
+                    clear_caches()
+                    post_action("Автомобіль додано!")
                 except Exception as e:
                     st.error(f"Помилка: {e}")
 
+    elif operation == "Імпорт з файлу (CSV/Excel)":
+        st.write("Колонки файлу: `brand, model, vin, year, mileage, owner` (email власника, порожньо = компанія). "
+                 "Будь-які інші колонки вважаються характеристиками (назва колонки = назва характеристики).")
+        uploaded = st.file_uploader("Файл з авто:", type=["csv", "xlsx", "xls"], key="import_file")
+
+        if uploaded is not None:
+            try:
+                raw_df = read_import_file(uploaded)
+                valid_df, errors_df = validate_import(raw_df, max_year=2025)
+            except Exception as e:
+                st.error(f"Помилка читання файлу: {e}")
+                st.stop()
+
+            known_chars = set(characteristics_df['name']) if characteristics_df is not None else set()
+            unknown_cols = [c for c in valid_df.columns if c not in BASE_COLUMNS + ['row_no'] and c not in known_chars]
+            if unknown_cols:
+                st.warning(f"Невідомі характеристики (будуть пропущені): {', '.join(unknown_cols)}")
+
+            c1, c2 = st.columns(2)
+            c1.metric("Коректних рядків", len(valid_df))
+            c2.metric("Рядків з помилками", len(errors_df))
+
+            if not errors_df.empty:
+                with st.expander("❌ Рядки з помилками"):
+                    st.dataframe(errors_df[['row_no', 'error', 'brand', 'model', 'vin', 'year', 'mileage']],
+                                 hide_index=True, use_container_width=True)
+
+            st.dataframe(valid_df.head(20), hide_index=True, use_container_width=True)
+
+            if st.button(f"📥 Імпортувати {len(valid_df)} авто", disabled=valid_df.empty, type="primary"):
+                try:
+                    new_ids = import_cars(valid_df)
+                    log_actions(st.session_state['user_id'], "INSERT", "Cars", new_ids, "Імпорт з файлу")
+                    clear_caches()
+                    skipped = len(valid_df) - len(new_ids)
+                    st.success(f"Імпортовано авто: {len(new_ids)}. Пропущено (VIN вже є / невідомий власник): {skipped}")
+                except Exception as e:
+                    st.error(f"Помилка імпорту: {e}")
+
     elif operation == "Створити оголошення":
         car_id_ann = st.selectbox("Оберіть авто для продажу:", options=filtered_df['car_id'])
         if car_id_ann:
@@ -245,16 +276,14 @@ if view_mode == "🗂️ Загальна база (Verified)":
                                 run_query(query, (car_id_ann, owner_id, title, desc, price), commit=True)
                                 log_action(st.session_state['user_id'], "INSERT/UPDATE", "Sale_Announcements", None,
                                            f"Оголошення компанії {car_id_ann}")
-                                st.cache_data.clear();
-                                st.success("Опубліковано!");
-                                time.sleep(1);
-                                st.rerun()
+                                clear_caches()
+                                post_action("Опубліковано!")
                             except Exception as e:
                                 st.error(f"Помилка: {e}")
 
     elif operation == "Видалити авто":
-        del_cid = st.selectbox("Авто для видалення:", options=filtered_df['car_id'])
-        if st.button("🗑️ Видалити назавжди"):
+        del_cid = car_selector("Авто для видалення:", key="del_car")
+        if st.button("🗑️ Видалити назавжди", disabled=del_cid is None):
             try:
                 with get_db_connection() as conn:
                     with conn.cursor() as cur:
@@ -263,10 +292,8 @@ if view_mode == "🗂️ Загальна база (Verified)":
                         cur.execute('DELETE FROM "Cars" WHERE car_id=%s', (del_cid,))
                     conn.commit()
                 log_action(st.session_state['user_id'], "DELETE", "Cars", int(del_cid), "Повне видалення")
-                st.cache_data.clear();
-                st.success("Видалено.");
-                time.sleep(1);
-                st.rerun()
+                clear_caches()
+                post_action("Видалено.")
             except Exception as e:
                 st.error(f"Помилка: {e}")
 
@@ -339,25 +366,8 @@ elif view_mode == "🛡️ Модерація (Pending & Rejected)":
                     try:
                         with get_db_connection() as conn:
                             with conn.cursor() as cur:
-                                # 1. Бренд
-                                cur.execute('SELECT brand_id FROM "Brands" WHERE name=%s', (new_brand,))
-                                res_b = cur.fetchone()
-                                if res_b:
-                                    bid = res_b[0]
-                                else:
-                                    cur.execute('INSERT INTO "Brands" (name) VALUES (%s) RETURNING brand_id',
-                                                (new_brand,)); bid = cur.fetchone()[0]
-
-                                # 2. Модель
-                                cur.execute('SELECT model_id FROM "Models" WHERE name=%s AND brand_id=%s',
-                                            (new_model, bid))
-                                res_m = cur.fetchone()
-                                if res_m:
-                                    mid = res_m[0]
-                                else:
-                                    cur.execute(
-                                        'INSERT INTO "Models" (brand_id, name) VALUES (%s, %s) RETURNING model_id',
-                                        (bid, new_model)); mid = cur.fetchone()[0]
+                                # 1-2. Бренд + Модель (один запит)
+                                mid = get_or_create_model(cur, new_brand, new_model)
 
                                 # 3. Оновлення
                                 cur.execute(
@@ -371,10 +381,8 @@ elif view_mode == "🛡️ Модерація (Pending & Rejected)":
                             conn.commit()
 
                         log_action(st.session_state['user_id'], "MODERATE", "Cars", mod_car_id, "Verified")
-                        st.cache_data.clear()  # ЧИСТИМО КЕШ
-                        st.success("Дані оновлено, авто підтверджено!")
-                        time.sleep(2)
-                        st.rerun()
+                        clear_caches()  # ЧИСТИМО КЕШ
+                        post_action("Дані оновлено, авто підтверджено!")
                     except Exception as e:
                         st.error(f"Помилка при збереженні: {e}")
 
@@ -390,10 +398,8 @@ elif view_mode == "🛡️ Модерація (Pending & Rejected)":
                                 (reason, mod_car_id), commit=True)
                             log_action(st.session_state['user_id'], "MODERATE", "Cars", mod_car_id,
                                        f"REJECTED: {reason}")
-                            st.cache_data.clear()  # ЧИСТИМО КЕШ
-                            st.warning("Заявку відхилено.")
-                            time.sleep(1)
-                            st.rerun()
+                            clear_caches()  # ЧИСТИМО КЕШ
+                            post_action("Заявку відхилено.", "warning")
 
             if status == 'rejected':
                 st.markdown("---")
@@ -405,11 +411,79 @@ elif view_mode == "🛡️ Модерація (Pending & Rejected)":
                                 cur.execute('DELETE FROM "Cars" WHERE car_id=%s', (mod_car_id,))
                             conn.commit()
                         log_action(st.session_state['user_id'], "DELETE", "Cars", mod_car_id, "Cleaned up")
-                        st.cache_data.clear()  # ЧИСТИМО КЕШ
-                        st.success("Видалено.");
-                        time.sleep(1);
-                        st.rerun()
+                        clear_caches()  # ЧИСТИМО КЕШ
+                        post_action("Видалено.")
                     except Exception as e:
                         st.error(f"Помилка: {e}")
     else:
-        st.success("Нових заявок немає.")
\ No newline at end of file
+        st.success("Нових заявок немає.")
+
+# ==============================================================================
+# РЕЖИМ 3: МАСОВА МОДЕРАЦІЯ
+# ==============================================================================
+elif view_mode == "📦 Масова модерація (Pending)":
+    st.subheader("📦 Черга на перевірку")
+
+    mod_df = load_moderation_data()
+    pending_df = mod_df[mod_df['verification_status'] == 'pending'] if mod_df is not None else pd.DataFrame()
+
+    if pending_df.empty:
+        st.success("Нових заявок немає.")
+    else:
+        st.info("👇 Виділіть кілька рядків (Shift/Ctrl) і застосуйте дію до всіх одразу.")
+
+        event = st.dataframe(
+            pending_df.drop(columns=['rejection_reason']),
+            use_container_width=True,
+            on_select="rerun",
+            selection_mode="multi-row",
+            hide_index=True,
+            key="bulk_mod_table"
+        )
+
+        sel_ids = [int(x) for x in pending_df.iloc[event.selection.rows]['car_id']]
+        st.caption(f"Обрано: {len(sel_ids)} з {len(pending_df)}")
+
+        def bulk_moderate(new_status, reason):
+            """Одна транзакція, один UPDATE на всі обрані авто. Повертає ID, які реально змінено."""
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    # verification_status='pending' в умові: авто, яке вже обробив інший менеджер, пропускаємо
+                    cur.execute("""
+                        UPDATE "Cars" SET verification_status=%s, rejection_reason=%s
+                        WHERE car_id = ANY(%s) AND verification_status='pending'
+                        RETURNING car_id;
+                    """, (new_status, reason, sel_ids))
+                    done = [r[0] for r in cur.fetchall()]
+                conn.commit()
+            return done
+
+        c_ok, c_bad = st.columns(2)
+
+        with c_ok:
+            if st.button(f"✅ Підтвердити обрані ({len(sel_ids)})", disabled=not sel_ids, type="primary"):
+                try:
+                    done = bulk_moderate('verified', None)
+                    log_actions(st.session_state['user_id'], "MODERATE", "Cars", done, "Verified (bulk)")
+                    clear_caches()
+                    post_action(f"Підтверджено: {len(done)}")
+                except Exception as e:
+                    st.error(f"Помилка: {e}")
+
+        with c_bad:
+            with st.form("bulk_reject_form"):
+                reason = st.text_input("Причина відхилення:", placeholder="Некоректні дані")
+                if st.form_submit_button(f"❌ Відхилити обрані ({len(sel_ids)})"):
+                    if not sel_ids:
+                        st.error("Нічого не обрано!")
+                    elif not reason:
+                        st.error("Вкажіть причину!")
+                    else:
+                        try:
+                            done = bulk_moderate('rejected', reason)
+                            log_actions(st.session_state['user_id'], "MODERATE", "Cars", done,
+                                        f"REJECTED (bulk): {reason}")
+                            clear_caches()
+                            post_action(f"Відхилено: {len(done)}", "warning")
+                        except Exception as e:
+                            st.error(f"Помилка: {e}")
@@ -1,11 +1,19 @@
 import streamlit as st
 from db_utils import run_query, log_action, get_db_connection
-from navigation import make_sidebar
+from navigation import make_sidebar, post_action
+from frame_cache import frame_cache, clear_caches
+from facets import load_facets, brand_counts, model_counts, facet_range, open_bound
+from widgets import user_selector
+from catalog import escape_like
 import pandas as pd
-import time
+import psycopg2
 
 st.set_page_config(page_title="Угоди", layout="wide")
 
+# Коди помилок функції create_deal
+DEAL_CONFLICT = 'MP409'
+DEAL_INVALID = 'MP400'
+
 # --- 🔒 ЗАХИСТ ДОСТУПУ ---
 if 'user_id' not in st.session_state or st.session_state['user_id'] is None:
     st.warning("Будь ласка, увійдіть в систему.")
@@ -23,32 +31,93 @@ st.title("🤝 Управління угодами (Deals)")
 
 
 # --- ЗАВАНТАЖЕННЯ ДАНИХ ---
+DEALS_PAGE_SIZE = 50
+
+DEALS_FROM = """
+    FROM public."Deals" d
+    JOIN public."Users" b_user ON d.buyer_user_id = b_user.user_id
+    JOIN public."Sale_Announcements" sa ON d.announcement_id = sa.announcement_id
+    JOIN public."Users" s_user ON sa.seller_user_id = s_user.user_id
+    JOIN public."Cars" c ON sa.car_id = c.car_id
+    JOIN public."Models" m ON c.model_id = m.model_id
+    JOIN public."Brands" b ON m.brand_id = b.brand_id
+"""
+
+
+def deals_where(filters):
+    """Фільтри історії угод -> (WHERE, параметри). filters = (search, brands, models, price_from, price_to)."""
+    search, brands, models, price_from, price_to = filters
+    conds, params = [], []
+    # None - межа відкрита (користувач не змінював значення з фасетів)
+    if price_from is not None:
+        conds.append("d.final_price >= %s")
+        params.append(price_from)
+    if price_to is not None:
+        conds.append("d.final_price <= %s")
+        params.append(price_to)
+    if search:
+        like = f"%{escape_like(search)}%"
+        conds.append("(b_user.email ILIKE %s ESCAPE '\\' OR s_user.email ILIKE %s ESCAPE '\\'"
+                     " OR (b.name || ' ' || m.name || ' (' || c.year || ')') ILIKE %s ESCAPE '\\')")
+        params += [like, like, like]
+    if brands:
+        conds.append("b.name = ANY(%s)")
+        params.append(list(brands))
+    if models:
+        conds.append("m.name = ANY(%s)")
+        params.append(list(models))
+    return (" WHERE " + " AND ".join(conds) if conds else ""), params
+
+
 @st.cache_data
-def load_data():
-    # 1. Історія угод (ВИПРАВЛЕНО: ДОДАНО model_name)
-    deals_query = """
+def load_deals_page(filters, cursor=None):
+    """
+    Одна сторінка історії (keyset по (deal_date, deal_id)).
+    cursor - (deal_date, deal_id) останнього рядка попередньої сторінки.
+    Повертає (DataFrame сторінки, cursor для наступної сторінки або None).
+    """
+    where, params = deals_where(filters)
+    if cursor is not None:
+        where += (" AND " if where else " WHERE ") + "(d.deal_date, d.deal_id) < (%s, %s)"
+        params += list(cursor)
+
+    query = f"""
     SELECT
         d.deal_id,
-        b.name AS brand_name, 
-        m.name AS model_name,  -- <--- ОСЬ ЦЬОГО НЕ ВИСТАЧАЛО
         b.name || ' ' || m.name || ' (' || c.year || ')' AS car_description,
         b_user.email AS buyer_email,
         s_user.email AS seller_email,
         d.final_price,
         d.deal_date,
         d.status
-    FROM public."Deals" d
-    JOIN public."Users" b_user ON d.buyer_user_id = b_user.user_id
-    JOIN public."Sale_Announcements" sa ON d.announcement_id = sa.announcement_id
-    JOIN public."Users" s_user ON sa.seller_user_id = s_user.user_id
-    JOIN public."Cars" c ON sa.car_id = c.car_id
-    JOIN public."Models" m ON c.model_id = m.model_id
-    JOIN public."Brands" b ON m.brand_id = b.brand_id
-    ORDER BY d.deal_date DESC;
+    {DEALS_FROM}
+    {where}
+    ORDER BY d.deal_date DESC, d.deal_id DESC
+    LIMIT %s;
     """
-    deals = run_query(deals_query, fetch="all")
+    df = run_query(query, tuple(params + [DEALS_PAGE_SIZE + 1]), fetch="all")
+    if df is None:
+        return None, None
 
-    # 2. Активні оголошення (Для створення)
+    next_cursor = None
+    if len(df) > DEALS_PAGE_SIZE:
+        df = df.iloc[:DEALS_PAGE_SIZE]
+        last = df.iloc[-1]
+        next_cursor = (last['deal_date'], int(last['deal_id']))
+    return df, next_cursor
+
+
+@st.cache_data
+def load_deals_summary(filters):
+    """Кількість угод і загальна сума за фільтрами (рахує БД)."""
+    where, params = deals_where(filters)
+    return run_query(f"SELECT COUNT(*), COALESCE(SUM(d.final_price), 0) {DEALS_FROM} {where};",
+                     tuple(params), fetch="one")
+
+
+@frame_cache()
+def load_data():
+    # Активні оголошення (Для створення)
     active_anns_query = """
     SELECT 
         sa.announcement_id, 
@@ -66,19 +135,10 @@ def load_data():
     WHERE sa.status = 'active'
     ORDER BY sa.announcement_id DESC;
     """
-    anns = run_query(active_anns_query, fetch="all")
-
-    # 3. Користувачі (Покупці)
-    users = run_query('SELECT user_id, email FROM public."Users" ORDER BY email;', fetch="all")
-
-    return deals, anns, users
-
+    return run_query(active_anns_query, fetch="all")
 
-deals_df, active_anns_df, users_df = load_data()
 
-if deals_df is None:
-    st.error("Помилка завантаження даних.")
-    st.stop()
+active_anns_df = load_data()
 
 # --- 🎨 САЙДБАР: ФІЛЬТРИ ---
 st.sidebar.header("Фільтри історії")
@@ -86,65 +146,68 @@ st.sidebar.header("Фільтри історії")
 # 1. Пошук
 search_query = st.sidebar.text_input("🔍 Пошук (Email, Авто):")
 
+facets = load_facets('deals')
+
 # 2. Бренд
-all_brands = sorted(deals_df['brand_name'].unique()) if not deals_df.empty else []
-brand_filter = st.sidebar.multiselect("Марка:", options=all_brands)
+brand_cnt = brand_counts(facets)
+brand_filter = st.sidebar.multiselect("Марка:", options=list(brand_cnt.index),
+                                      format_func=lambda b: f"{b} ({brand_cnt[b]})")
 
 # 3. Модель (Залежний фільтр)
-if brand_filter:
-    available_models = sorted(deals_df[deals_df['brand_name'].isin(brand_filter)]['model_name'].unique())
-else:
-    # Тепер це працюватиме, бо колонка model_name існує
-    available_models = sorted(deals_df['model_name'].unique()) if not deals_df.empty else []
-
-model_filter = st.sidebar.multiselect("Модель:", options=available_models)
+model_cnt = model_counts(facets, brand_filter)
+model_filter = st.sidebar.multiselect("Модель:", options=list(model_cnt.index),
+                                      format_func=lambda m: f"{m} ({model_cnt.get(m, 0)})")
 
 # 4. Ціна (Фінальна ціна угоди)
-if not deals_df.empty:
-    min_p = int(deals_df['final_price'].min())
-    max_p = int(deals_df['final_price'].max())
-else:
-    min_p, max_p = 0, 100000
+min_p, max_p = facet_range(facets, 'price', brand_filter, model_filter)
 
 c_p1, c_p2 = st.sidebar.columns(2)
 price_from = c_p1.number_input("Ціна від ($)", min_value=0, value=min_p, step=500)
 price_to = c_p2.number_input("Ціна до ($)", min_value=0, value=max_p, step=500)
 
-# --- ЗАСТОСУВАННЯ ФІЛЬТРІВ ---
-filtered_df = deals_df.copy()
-
-if search_query:
-    mask = (
-            filtered_df['buyer_email'].str.contains(search_query, case=False) |
-            filtered_df['seller_email'].str.contains(search_query, case=False) |
-            filtered_df['car_description'].str.contains(search_query, case=False)
-    )
-    filtered_df = filtered_df[mask]
+# --- ЗАСТОСУВАННЯ ФІЛЬТРІВ (в SQL) ---
+filters = (search_query.strip(), tuple(brand_filter), tuple(model_filter),
+           open_bound(price_from, min_p), open_bound(price_to, max_p))
 
-if brand_filter:
-    filtered_df = filtered_df[filtered_df['brand_name'].isin(brand_filter)]
+# Стек курсорів сторінок; при зміні фільтрів починаємо з першої сторінки
+if st.session_state.get('deals_filters') != filters:
+    st.session_state['deals_filters'] = filters
+    st.session_state['deals_cursors'] = [None]
+cursors = st.session_state['deals_cursors']
 
-if model_filter:
-    filtered_df = filtered_df[filtered_df['model_name'].isin(model_filter)]
+deals_df, next_cursor = load_deals_page(filters, cursors[-1])
 
-# Фільтр по ціні
-filtered_df = filtered_df[(filtered_df['final_price'] >= price_from) & (filtered_df['final_price'] <= price_to)]
+if deals_df is None:
+    st.error("Помилка завантаження даних.")
+    st.stop()
 
 # --- ВІДОБРАЖЕННЯ ---
 st.subheader("📜 Історія угод")
 
-if not filtered_df.empty:
-    # Вибираємо колонки для показу (ховаємо технічні brand_name та model_name)
-    display_cols = ['deal_id', 'car_description', 'final_price', 'buyer_email', 'seller_email', 'deal_date', 'status']
+summary = load_deals_summary(filters)
+if summary:
+    s1, s2 = st.columns(2)
+    s1.metric("Угод за фільтрами", f"{summary[0]}")
+    s2.metric("Загальна сума", f"${float(summary[1]):,.0f}")
 
+if not deals_df.empty:
     st.dataframe(
-        filtered_df[display_cols],
+        deals_df,
         use_container_width=True,
         hide_index=True
     )
 else:
     st.info("Історія порожня або нічого не знайдено.")
 
+n1, n2, n3 = st.columns([1, 2, 1])
+if n1.button("← Назад", disabled=len(cursors) == 1):
+    cursors.pop()
+    st.rerun()
+n2.caption(f"Сторінка {len(cursors)}")
+if n3.button("Далі →", disabled=next_cursor is None):
+    cursors.append(next_cursor)
+    st.rerun()
+
 st.divider()
 
 # --- CRUD ОПЕРАЦІЇ ---
@@ -175,47 +238,42 @@ if operation == "Оформити нову угоду":
 
         st.info(f"Вибрано: **{sel_ann['title']}** (VIN: {sel_ann['vin_code']})")
 
+        # Пошук покупця поза формою: підказки підтягуються з БД під час введення
+        buyer_id = user_selector("Покупець:", key="deal_buyer")
+
         with st.form("create_deal"):
-            c1, c2 = st.columns(2)
-            buyer_id = c1.selectbox(
-                "Покупець:",
-                options=users_df['user_id'],
-                format_func=lambda x: users_df.loc[users_df['user_id'] == x, 'email'].iloc[0]
-            )
-            final_price = c2.number_input("Фінальна ціна угоди ($):", value=float(sel_ann['price']), min_value=0.0)
+            final_price = st.number_input("Фінальна ціна угоди ($):", value=float(sel_ann['price']), min_value=0.0)
 
             if st.form_submit_button("✅ Підтвердити угоду"):
-                if buyer_id == sel_ann['seller_user_id']:
+                if buyer_id is None:
+                    st.error("Оберіть покупця!")
+                elif buyer_id == sel_ann['seller_user_id']:
                     st.error("Помилка: Продавець не може купити авто сам у себе!")
                 else:
                     try:
                         with get_db_connection() as conn:
                             with conn.cursor() as cur:
-                                # 1. Створення Deal
-                                cur.execute(
-                                    'INSERT INTO public."Deals" (announcement_id, buyer_user_id, final_price) VALUES (%s, %s, %s) RETURNING deal_id;',
-                                    (int(ann_id), buyer_id, final_price)
-                                )
+                                # Блокування оголошення, перевірка статусу, Deal + 'sold' + зміна власника -
+                                # все в одній функції БД (migrations/006_create_deal.sql)
+                                cur.execute('SELECT public.create_deal(%s, %s, %s);',
+                                            (int(ann_id), buyer_id, final_price))
                                 new_deal_id = cur.fetchone()[0]
 
-                                # 2. Закриття Оголошення
-                                cur.execute(
-                                    "UPDATE public.\"Sale_Announcements\" SET status = 'sold' WHERE announcement_id = %s;",
-                                    (int(ann_id),))
-
-                                # 3. Зміна Власника авто
-                                cur.execute("UPDATE public.\"Cars\" SET owner_id = %s WHERE car_id = %s;",
-                                            (buyer_id, int(sel_ann['car_id'])))
-
                             conn.commit()
 
                         log_action(st.session_state['user_id'], "TRANSACTION", "Deals", new_deal_id,
                                    f"Продаж авто ID {sel_ann['car_id']}")
-                        st.cache_data.clear()  # Очистка кешу
-                        st.balloons()
-                        st.success(f"Угоду #{new_deal_id} успішно оформлено! Власника змінено.")
-                        time.sleep(2)
-                        st.rerun()
+                        clear_caches()  # Очистка кешу
+                        post_action(f"Угоду #{new_deal_id} успішно оформлено! Власника змінено.", balloons=True)
+                    except psycopg2.Error as e:
+                        if e.pgcode == DEAL_CONFLICT:
+                            # Інший менеджер встиг продати це авто - перемальовуємо список без нього
+                            clear_caches()
+                            post_action(f"Конфлікт: {e.diag.message_primary}. Оберіть інше оголошення.", kind="error")
+                        elif e.pgcode == DEAL_INVALID:
+                            st.error(f"Помилка: {e.diag.message_primary}")
+                        else:
+                            st.error(f"Помилка транзакції: {e}")
                     except Exception as e:
                         st.error(f"Помилка транзакції: {e}")
 
@@ -224,6 +282,7 @@ if operation == "Оформити нову угоду":
 # ==========================================
 elif operation == "Змінити статус угоди":
     if not deals_df.empty:
+        # Вибір з поточної сторінки історії
         deal_id = st.selectbox("Оберіть угоду:", options=deals_df['deal_id'])
         if deal_id:
             curr_status = deals_df[deals_df['deal_id'] == deal_id]['status'].iloc[0]
@@ -236,10 +295,8 @@ elif operation == "Змінити статус угоди":
             if st.button("Оновити статус"):
                 run_query('UPDATE public."Deals" SET status=%s WHERE deal_id=%s', (new_status, deal_id), commit=True)
                 log_action(st.session_state['user_id'], "UPDATE", "Deals", int(deal_id), f"Статус: {new_status}")
-                st.cache_data.clear()
-                st.success("Оновлено.")
-                time.sleep(1)
-                st.rerun()
+                clear_caches()
+                post_action("Оновлено.")
     else:
         st.warning("Історія порожня.")
 
@@ -255,10 +312,8 @@ elif operation == "Видалити запис":
             try:
                 run_query('DELETE FROM public."Deals" WHERE deal_id=%s', (deal_id,), commit=True)
                 log_action(st.session_state['user_id'], "DELETE", "Deals", int(deal_id), "Видалено запис про угоду")
-                st.cache_data.clear()
-                st.success("Видалено.")
-                time.sleep(1)
-                st.rerun()
+                clear_caches()
+                post_action("Видалено.")
             except Exception as e:
                 st.error(f"Помилка: {e}")
     else:
@@ -1,11 +1,12 @@
 import streamlit as st
 from db_utils import run_query, log_action, get_db_connection
 from auth import make_hash  # <--- ПОТРІБНО ДЛЯ ПАРОЛІВ
-from navigation import make_sidebar
+from navigation import make_sidebar, post_action
+from frame_cache import frame_cache, clear_caches
+from frame_filter import filter_frame
 import pandas as pd
 import psycopg2
 from faker import Faker
-import time
 
 st.set_page_config(page_title="Співробітники", layout="wide")
 
@@ -26,7 +27,7 @@ st.title("🧑‍💼 Управління персоналом")
 
 
 # --- ЗАВАНТАЖЕННЯ ДАНИХ ---
-@st.cache_data
+@frame_cache()
 def load_data():
     # Об'єднуємо Employees та Users, щоб бачити роль і телефон
     employees_query = """
@@ -65,23 +66,12 @@ search_query = st.sidebar.text_input("🔍 Пошук (Ім'я / Email):")
 role_filter = st.sidebar.multiselect("Посада:", options=employees_df['position'].unique())
 status_filter = st.sidebar.radio("Статус:", ["Всі", "Активні", "Звільнені"])
 
-filtered_df = employees_df.copy()
+active_filter = {"Активні": {'is_active': True}, "Звільнені": {'is_active': False}}.get(status_filter)
 
-if search_query:
-    mask = (
-            filtered_df['first_name'].str.contains(search_query, case=False) |
-            filtered_df['last_name'].str.contains(search_query, case=False) |
-            filtered_df['email'].str.contains(search_query, case=False)
-    )
-    filtered_df = filtered_df[mask]
-
-if role_filter:
-    filtered_df = filtered_df[filtered_df['position'].isin(role_filter)]
-
-if status_filter == "Активні":
-    filtered_df = filtered_df[filtered_df['is_active'] == True]
-elif status_filter == "Звільнені":
-    filtered_df = filtered_df[filtered_df['is_active'] == False]
+filtered_df = filter_frame(
+    employees_df, search=search_query, search_cols=('first_name', 'last_name', 'email'),
+    isin={'position': role_filter}, equals=active_filter
+)
 
 # --- ВІДОБРАЖЕННЯ ---
 st.dataframe(filtered_df, use_container_width=True)
@@ -152,12 +142,10 @@ if operation == "Створити акаунт менеджера":
 
                     log_action(st.session_state['user_id'], "INSERT", "Users/Employees", emp_id,
                                f"Створено менеджера {email}")
-                    st.success(f"Акаунт створено! ID: {emp_id}. Можна входити.")
 
                     if 'new_emp' in st.session_state: del st.session_state['new_emp']
-                    st.cache_data.clear()
-                    time.sleep(2)
-                    st.rerun()
+                    clear_caches()
+                    post_action(f"Акаунт створено! ID: {emp_id}. Можна входити.")
 
                 except Exception as e:
                     st.error(f"Помилка (можливо такий email вже є): {e}")
@@ -209,10 +197,8 @@ elif operation == "Редагувати дані":
 
                     log_action(st.session_state['user_id'], "UPDATE", "Employees", int(emp_id),
                                f"Оновлено дані для {new_email}")
-                    st.success("Дані оновлено!")
-                    st.cache_data.clear()
-                    time.sleep(1)
-                    st.rerun()
+                    clear_caches()
+                    post_action("Дані оновлено!")
                 except Exception as e:
                     st.error(f"Помилка: {e}")
 
@@ -238,9 +224,7 @@ elif operation == "Деактивувати (Звільнити)":
                 conn.commit()
 
             log_action(st.session_state['user_id'], "DEACTIVATE", "Employees", int(emp_id), "Звільнення співробітника")
-            st.success("Співробітника деактивовано.")
-            st.cache_data.clear()
-            time.sleep(1)
-            st.rerun()
+            clear_caches()
+            post_action("Співробітника деактивовано.")
         except Exception as e:
             st.error(f"Помилка: {e}")
\ No newline at end of file
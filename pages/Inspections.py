@@ -1,9 +1,13 @@
 import streamlit as st
 from db_utils import run_query, log_action, get_db_connection
 import pandas as pd
+from psycopg2.extras import execute_values
 import datetime
-import time
-from navigation import make_sidebar
+from decimal import Decimal, ROUND_HALF_UP
+from navigation import make_sidebar, post_action
+from frame_cache import frame_cache, clear_caches
+from frame_filter import filter_frame
+from facets import load_facets, brand_counts, model_counts
 
 st.set_page_config(page_title="Технічні інспекції", layout="wide")
 
@@ -25,9 +29,9 @@ st.title("🔧 Технічні інспекції")
 STANDARD_CHECKPOINTS = ["Двигун", "Коробка передач", "Ходова частина", "Кузов та ЛФП", "Салон", "Електроніка"]
 
 
-@st.cache_data
+@frame_cache()
 def load_data():
-    # 1. Історія інспекцій (ОНОВЛЕНО: Додано AVG рейтинг та окремі колонки бренду/моделі)
+    # 1. Історія інспекцій (рейтинг зберігається в Inspections.avg_rating при створенні звіту)
     history_query = """
     SELECT 
         i.inspection_id,
@@ -39,15 +43,13 @@ def load_data():
         e.first_name || ' ' || e.last_name AS inspector_name,
         i.inspection_date,
         i.final_conclusion,
-        ROUND(AVG(ic.rating), 1) as avg_rating
+        i.avg_rating
     FROM public."Inspections" i
     JOIN public."Buyback_Requests" br ON i.request_id = br.request_id
     JOIN public."Cars" c ON br.car_id = c.car_id
     JOIN public."Models" m ON c.model_id = m.model_id
     JOIN public."Brands" b ON m.brand_id = b.brand_id
     JOIN public."Employees" e ON i.inspector_id = e.employee_id
-    LEFT JOIN public."Inspection_Checkpoints" ic ON i.inspection_id = ic.inspection_id
-    GROUP BY i.inspection_id, br.request_id, b.name, m.name, c.vin_code, e.first_name, e.last_name
     ORDER BY i.inspection_date DESC;
     """
     hist_df = run_query(history_query, fetch="all")
@@ -69,7 +71,7 @@ def load_data():
     JOIN public."Models" m ON c.model_id = m.model_id
     JOIN public."Brands" b ON m.brand_id = b.brand_id
     WHERE br.status NOT IN ('completed', 'rejected')
-      AND br.request_id NOT IN (SELECT request_id FROM public."Inspections")
+      AND NOT EXISTS (SELECT 1 FROM public."Inspections" i WHERE i.request_id = br.request_id)
     ORDER BY br.request_id ASC; 
     """
     pending_df = run_query(pending_query, fetch="all")
@@ -85,42 +87,25 @@ st.sidebar.header("Фільтри")
 search_q = st.sidebar.text_input("🔍 Пошук (VIN, ID):")
 
 # Фільтри по бренду та моделі
-all_brands = sorted(history_df['brand'].unique()) if history_df is not None and not history_df.empty else []
-brand_filter = st.sidebar.multiselect("Марка:", options=all_brands)
+facets = load_facets('inspections')
+brand_cnt = brand_counts(facets)
+brand_filter = st.sidebar.multiselect("Марка:", options=list(brand_cnt.index),
+                                      format_func=lambda b: f"{b} ({brand_cnt[b]})")
 
 # Фільтр по моделі (залежить від бренду)
-if brand_filter:
-    available_models = sorted(history_df[history_df['brand'].isin(brand_filter)]['model'].unique())
-else:
-    available_models = sorted(history_df['model'].unique()) if history_df is not None and not history_df.empty else []
-
-model_filter = st.sidebar.multiselect("Модель:", options=available_models)
+model_cnt = model_counts(facets, brand_filter)
+model_filter = st.sidebar.multiselect("Модель:", options=list(model_cnt.index),
+                                      format_func=lambda m: f"{m} ({model_cnt.get(m, 0)})")
 
 # Фільтр по рейтингу
 rating_range = st.sidebar.slider("Рейтинг інспекції:", 1.0, 5.0, (1.0, 5.0), step=0.5)
 
 # --- ЗАСТОСУВАННЯ ФІЛЬТРІВ ---
-filtered_df = history_df.copy()
-
-if search_q:
-    mask = (
-            filtered_df['car_info'].str.contains(search_q, case=False, na=False) |
-            filtered_df['vin_code'].str.contains(search_q, case=False, na=False) |
-            filtered_df['request_id'].astype(str).str.contains(search_q, case=False, na=False)
-    )
-    filtered_df = filtered_df[mask]
-
-if brand_filter:
-    filtered_df = filtered_df[filtered_df['brand'].isin(brand_filter)]
-
-if model_filter:
-    filtered_df = filtered_df[filtered_df['model'].isin(model_filter)]
-
-# Фільтр по рейтингу
-filtered_df = filtered_df[
-    (filtered_df['avg_rating'] >= rating_range[0]) &
-    (filtered_df['avg_rating'] <= rating_range[1])
-    ]
+filtered_df = filter_frame(
+    history_df, search=search_q, search_cols=('car_info', 'vin_code', 'request_id'),
+    isin={'brand': brand_filter, 'model': model_filter},
+    ranges={'avg_rating': rating_range}
+)
 
 # --- ВІДОБРАЖЕННЯ ТАБЛИЦІ ---
 if filtered_df is not None and not filtered_df.empty:
@@ -183,23 +168,25 @@ if operation == "Провести нову інспекцію":
                 try:
                     with get_db_connection() as conn:
                         with conn.cursor() as cur:
+                            # Округлення як у Postgres ROUND (половина - від нуля), що й у бекфілі 009
+                            avg_rating = (Decimal(sum(rat for rat, _ in results.values())) / len(results)).quantize(
+                                Decimal("0.1"), ROUND_HALF_UP)
                             cur.execute(
-                                """INSERT INTO "Inspections" (request_id, inspector_id, inspection_date, location, final_conclusion) VALUES (%s, %s, %s, %s, %s) RETURNING inspection_id;""",
-                                (req_id, insp_id, insp_date, location, final_text))
+                                """INSERT INTO "Inspections" (request_id, inspector_id, inspection_date, location, final_conclusion, avg_rating) VALUES (%s, %s, %s, %s, %s, %s) RETURNING inspection_id;""",
+                                (req_id, insp_id, insp_date, location, final_text, avg_rating))
                             new_id = cur.fetchone()[0]
-                            for name, (rat, comm) in results.items():
-                                cur.execute(
-                                    """INSERT INTO "Inspection_Checkpoints" (inspection_id, checkpoint_name, rating, comment) VALUES (%s, %s, %s, %s);""",
-                                    (new_id, name, rat, comm))
+                            # Всі чекпоінти одним multi-row INSERT
+                            execute_values(
+                                cur,
+                                """INSERT INTO "Inspection_Checkpoints" (inspection_id, checkpoint_name, rating, comment) VALUES %s;""",
+                                [(new_id, name, rat, comm) for name, (rat, comm) in results.items()])
                             cur.execute(
                                 "UPDATE \"Buyback_Requests\" SET status = 'inspection_scheduled' WHERE request_id = %s AND status = 'new';",
                                 (req_id,))
                         conn.commit()
                     log_action(st.session_state['user_id'], "INSERT", "Inspections", new_id, f"Insp for Req {req_id}")
-                    st.success("Збережено!");
-                    st.cache_data.clear();
-                    time.sleep(1);
-                    st.rerun()
+                    clear_caches()
+                    post_action("Збережено!")
                 except Exception as e:
                     st.error(f"Помилка: {e}")
 
@@ -238,9 +225,7 @@ elif operation == "Видалити звіт":
         try:
             run_query('DELETE FROM "Inspections" WHERE inspection_id=%s', (del_id,), commit=True)
             log_action(st.session_state['user_id'], "DELETE", "Inspections", int(del_id), "Deleted report")
-            st.success("Видалено.");
-            st.cache_data.clear();
-            time.sleep(1);
-            st.rerun()
+            clear_caches()
+            post_action("Видалено.")
         except Exception as e:
             st.error(f"Помилка: {e}")
\ No newline at end of file
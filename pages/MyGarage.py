@@ -1,8 +1,8 @@
 import streamlit as st
-from db_utils import run_query, log_action, get_db_connection
-from navigation import make_sidebar
+from db_utils import run_query, log_action, get_db_connection, get_or_create_model
+from navigation import make_sidebar, post_action
+from frame_cache import clear_caches
 import pandas as pd
-import time
 
 st.set_page_config(page_title="Мій Гараж", layout="wide")
 
@@ -28,7 +28,15 @@ def load_my_data(uid):
         b.name AS brand, m.name AS model, c.year,
         b.name || ' ' || m.name || ' (' || c.year || ')' AS title, 
         c.vin_code, c.mileage,
-        c.verification_status, c.rejection_reason
+        c.verification_status, c.rejection_reason,
+        EXISTS (
+            SELECT 1 FROM public."Sale_Announcements" sa
+            WHERE sa.car_id = c.car_id AND sa.status = 'active'
+        ) AS on_p2p,
+        EXISTS (
+            SELECT 1 FROM public."Buyback_Requests" br
+            WHERE br.car_id = c.car_id AND br.status NOT IN ('completed', 'rejected')
+        ) AS on_tradein
     FROM public."Cars" c
     JOIN public."Models" m ON c.model_id = m.model_id
     JOIN public."Brands" b ON m.brand_id = b.brand_id
@@ -102,16 +110,7 @@ with st.expander("Натисніть, щоб додати авто"):
                 try:
                     with get_db_connection() as conn:
                         with conn.cursor() as cur:
-                            cur.execute('SELECT brand_id FROM "Brands" WHERE name=%s', (brand,))
-                            res = cur.fetchone()
-                            b_id = res[0] if res else cur.execute(
-                                'INSERT INTO "Brands" (name) VALUES (%s) RETURNING brand_id', (brand,)) or \
-                                                      cur.fetchone()[0]
-                            cur.execute('SELECT model_id FROM "Models" WHERE name=%s AND brand_id=%s', (model, b_id))
-                            res = cur.fetchone()
-                            m_id = res[0] if res else cur.execute(
-                                'INSERT INTO "Models" (brand_id, name) VALUES (%s, %s) RETURNING model_id',
-                                (b_id, model)) or cur.fetchone()[0]
+                            m_id = get_or_create_model(cur, brand, model)
                             cur.execute(
                                 """INSERT INTO "Cars" (model_id, owner_id, vin_code, year, mileage, verification_status) VALUES (%s, %s, %s, %s, %s, 'pending') RETURNING car_id;""",
                                 (m_id, CURRENT_USER, vin, year, mileage))
@@ -121,28 +120,16 @@ with st.expander("Натисніть, щоб додати авто"):
                                                              (new_car_id, cid, cval.strip()))
                         conn.commit()
                     log_action(CURRENT_USER, "INSERT", "Cars", new_car_id, f"Заявка на реєстрацію авто {brand} {model}")
-                    st.success("Заявку відправлено! Очікуйте підтвердження менеджера.")
-                    st.cache_data.clear()
-                    time.sleep(2)
-                    st.rerun()
+                    clear_caches()
+                    post_action("Заявку відправлено! Очікуйте підтвердження менеджера.")
                 except Exception as e:
                     st.error(f"Помилка: {e}")
 
 st.divider()
 
-# ==========================================
-# 2. СПИСОК АВТО
-# ==========================================
-st.subheader("🚘 Мої автомобілі")
-
-if cars_df is not None and not cars_df.empty:
-    def highlight_status(val):
-        color = '#d4edda' if val == 'verified' else '#fff3cd' if val == 'pending' else '#f8d7da'
-        return f'background-color: {color}; color: black'
-
-
-    st.dataframe(cars_df.style.map(highlight_status, subset=['verification_status']), use_container_width=True)
-
+# Вибір авто та дії з ним - окремий фрагмент: перемикання між авто не перемальовує весь гараж
+@st.fragment
+def car_actions(cars_df):
     st.write("⚡ **Дії з вибраним авто:**")
 
 
@@ -156,21 +143,11 @@ if cars_df is not None and not cars_df.empty:
 
     sel_car = st.selectbox("Оберіть авто зі списку:", options=cars_df['car_id'], format_func=fmt_car)
 
-    # --- ПРЯМА ПЕРЕВІРКА В БД ---
-    p2p_check = run_query(
-        'SELECT announcement_id FROM "Sale_Announcements" WHERE car_id=%s AND status=\'active\'',
-        (int(sel_car),), fetch="one"
-    )
-    on_p2p = p2p_check is not None
-
-    trade_check = run_query(
-        'SELECT request_id FROM "Buyback_Requests" WHERE car_id=%s AND status NOT IN (\'completed\', \'rejected\')',
-        (int(sel_car),), fetch="one"
-    )
-    on_tradein = trade_check is not None
-
+    # Статуси P2P / Trade-in приходять разом з авто (load_my_data), тут БД не чіпаємо
     car_row = cars_df[cars_df['car_id'] == sel_car].iloc[0]
     status = car_row['verification_status']
+    on_p2p = bool(car_row['on_p2p'])
+    on_tradein = bool(car_row['on_tradein'])
 
     # --- ВІДОБРАЖЕННЯ СТАТУСУ ---
     if on_p2p:
@@ -202,10 +179,8 @@ if cars_df is not None and not cars_df.empty:
                             """, (sel_car, CURRENT_USER, car_row['title'], p_desc, p_price), commit=True)
 
                             log_action(CURRENT_USER, "INSERT", "Sale_Announcements", None, f"Оголошення: {sel_car}")
-                            st.success("Готово!")
-                            st.cache_data.clear()
-                            time.sleep(1)
-                            st.rerun()
+                            clear_caches()
+                            post_action("Готово!")
                         except Exception as e:
                             st.error(f"Помилка: {e}")
 
@@ -224,10 +199,8 @@ if cars_df is not None and not cars_df.empty:
                             'INSERT INTO "Buyback_Requests" (car_id, user_id, desired_price, status) VALUES (%s, %s, %s, \'new\')',
                             (sel_car, CURRENT_USER, t_price), commit=True)
                         log_action(CURRENT_USER, "INSERT", "Buyback_Requests", None, f"Trade-in: {sel_car}")
-                        st.success("Відправлено!")
-                        st.cache_data.clear()
-                        time.sleep(1)
-                        st.rerun()
+                        clear_caches()
+                        post_action("Відправлено!")
 
     # --- REJECTED ---
     elif status == 'rejected':
@@ -242,20 +215,32 @@ if cars_df is not None and not cars_df.empty:
                         WHERE car_id=%s
                     """, (n_vin, n_mileage, sel_car), commit=True)
                     log_action(CURRENT_USER, "UPDATE", "Cars", int(sel_car), "Resubmitted")
-                    st.success("Відправлено!");
-                    st.cache_data.clear();
-                    time.sleep(1);
-                    st.rerun()
+                    clear_caches()
+                    post_action("Відправлено!")
 
     # --- PENDING ---
     elif status == 'pending':
         st.warning("⏳ Автомобіль знаходиться на перевірці.")
         if st.button("Скасувати заявку (Видалити)", key=f"del_pend_{sel_car}"):
             run_query('DELETE FROM "Cars" WHERE car_id=%s', (sel_car,), commit=True)
-            st.success("Скасовано.");
-            st.cache_data.clear();
-            time.sleep(1);
-            st.rerun()
+            clear_caches()
+            post_action("Скасовано.")
+
+
+# ==========================================
+# 2. СПИСОК АВТО
+# ==========================================
+st.subheader("🚘 Мої автомобілі")
+
+if cars_df is not None and not cars_df.empty:
+    def highlight_status(val):
+        color = '#d4edda' if val == 'verified' else '#fff3cd' if val == 'pending' else '#f8d7da'
+        return f'background-color: {color}; color: black'
+
+
+    st.dataframe(cars_df.style.map(highlight_status, subset=['verification_status']), use_container_width=True)
+
+    car_actions(cars_df)
 
 else:
     st.info("У вас немає зареєстрованих автомобілів.")
@@ -275,12 +260,12 @@ if req_df is not None and not req_df.empty:
                     run_query("UPDATE \"Buyback_Requests\" SET status='approved' WHERE request_id=%s",
                               (row['request_id'],), commit=True)
                     log_action(CURRENT_USER, "UPDATE", "Buyback_Requests", row['request_id'], "Accepted offer")
-                    st.cache_data.clear();
+                    clear_caches();
                     st.rerun()
                 if c2.button("❌ Відхилити", key=f"n{row['request_id']}"):
                     run_query("UPDATE \"Buyback_Requests\" SET status='rejected' WHERE request_id=%s",
                               (row['request_id'],), commit=True)
-                    st.cache_data.clear();
+                    clear_caches();
                     st.rerun()
             else:
                 st.info("В обробці.")
@@ -0,0 +1,136 @@
+# reports.py
+# SQL звітів аналітики з прив'язаними параметрами + кеш результатів за (звіт, нормалізований період).
+import datetime
+import threading
+import time
+import streamlit as st
+from db_utils import run_query, run_queries_parallel
+
+# --- КОНСТАНТИ ---
+COMMISSION_RATE = 0.05
+COMPANY_EMAIL = 'company@marketplace.com'
+
+# Скільки секунд кешуємо готовий звіт (спільно для всіх адмінів процесу)
+REPORT_CACHE_TTL = 300
+REPORT_TIMEOUT = 30
+
+# Параметри: %(start)s / %(end)s - напіввідкритий інтервал [start, end), %(company_id)s, %(commission)s
+REPORT_SQL = {
+    'finance': """
+        WITH DealDetails AS (
+            SELECT
+                d.deal_id, d.final_price, d.deal_date, sa.car_id,
+                (sa.seller_user_id = %(company_id)s) AS is_company_deal
+            FROM public."Deals" d
+            JOIN public."Sale_Announcements" sa ON d.announcement_id = sa.announcement_id
+            WHERE d.deal_date >= %(start)s AND d.deal_date < %(end)s
+        ),
+        LatestBuybackCosts AS (
+            SELECT car_id, COALESCE(offer_price, desired_price) AS cost_price
+            FROM (
+                SELECT car_id, offer_price, desired_price,
+                       ROW_NUMBER() OVER(PARTITION BY car_id ORDER BY request_date DESC) as rn
+                FROM public."Buyback_Requests" 
+                WHERE status = 'completed'
+            ) AS RankedCosts
+            WHERE rn = 1
+        ),
+        Monthly AS (
+        SELECT
+            date_trunc('month', dd.deal_date)::date AS sales_month,
+            SUM(COALESCE(CASE WHEN dd.is_company_deal THEN dd.final_price - lbc.cost_price ELSE 0 END, 0))::bigint AS resale_margin,
+            SUM(CASE WHEN NOT dd.is_company_deal THEN dd.final_price * %(commission)s ELSE 0 END)::bigint AS commission_revenue,
+            SUM(dd.final_price)::bigint AS total_turnover,
+            COUNT(CASE WHEN dd.is_company_deal THEN 1 END) AS count_tradein,
+            COUNT(CASE WHEN NOT dd.is_company_deal THEN 1 END) AS count_p2p,
+            COUNT(dd.deal_id) AS total_deals
+        FROM DealDetails dd
+        LEFT JOIN LatestBuybackCosts lbc ON dd.car_id = lbc.car_id
+        GROUP BY sales_month
+        )
+        SELECT *, resale_margin + commission_revenue AS "Net Income"
+        FROM Monthly
+        ORDER BY sales_month ASC;
+    """,
+
+    'brands': """
+        SELECT b.name AS brand_name, COUNT(d.deal_id) AS deals_count, SUM(d.final_price) AS total_volume
+        FROM public."Deals" d
+        JOIN public."Sale_Announcements" sa ON d.announcement_id = sa.announcement_id
+        JOIN public."Cars" c ON sa.car_id = c.car_id
+        JOIN public."Models" m ON c.model_id = m.model_id
+        JOIN public."Brands" b ON m.brand_id = b.brand_id
+        WHERE d.deal_date >= %(start)s AND d.deal_date < %(end)s
+        GROUP BY b.name ORDER BY deals_count DESC LIMIT 10;
+    """,
+
+    # KPI за період з щоденних агрегатів (migrations/010_manager_kpi_daily.sql)
+    'managers': """
+        SELECT e.first_name || ' ' || e.last_name AS manager_name,
+            SUM(k.completed_buybacks) AS completed_buybacks,
+            (SUM(k.offer_sum) / NULLIF(SUM(k.offer_count), 0))::numeric(10,2) AS avg_buy_price,
+            (SUM(k.ratio_sum) / NULLIF(SUM(k.ratio_count), 0))::numeric(5,3) AS offer_to_desired,
+            SUM(k.inspections) AS inspections
+        FROM public.manager_kpi_daily k
+        JOIN public."Employees" e ON k.manager_id = e.employee_id
+        WHERE k.day >= %(start)s AND k.day < %(end)s
+        GROUP BY e.employee_id, manager_name
+        HAVING SUM(k.completed_buybacks) > 0 OR SUM(k.inspections) > 0
+        ORDER BY completed_buybacks DESC;
+    """,
+}
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+@st.cache_data
+def company_user_id():
+    """user_id службового акаунта компанії (визначається один раз на процес)."""
+    res = run_query('SELECT user_id FROM public."Users" WHERE email = %s', (COMPANY_EMAIL,), fetch="one")
+    return res[0] if res else -1
+
+
+def normalize_range(start_date, end_date):
+    """Період з UI -> напіввідкритий інтервал [start, end + 1 день), щоб день end_date входив повністю."""
+    return start_date, end_date + datetime.timedelta(days=1)
+
+
+def report_params(start_date, end_date):
+    """Параметри звітів для періоду з UI (спільні для load_reports і фонового експорту)."""
+    start, end = normalize_range(start_date, end_date)
+    return {'start': start, 'end': end, 'company_id': company_user_id(), 'commission': COMMISSION_RATE}
+
+
+def load_reports(names, start_date, end_date):
+    """
+    Повертає (results, errors) для списку звітів за період.
+    Готові результати беруться з кешу, решта виконуються паралельно (run_queries_parallel).
+    """
+    params = report_params(start_date, end_date)
+    start, end = params['start'], params['end']
+    now = time.time()
+
+    results, missing = {}, {}
+    with _cache_lock:
+        for name in names:
+            hit = _cache.get((name, start, end))
+            if hit and now - hit[0] < REPORT_CACHE_TTL:
+                results[name] = hit[1]
+            else:
+                missing[name] = (REPORT_SQL[name], params)
+
+    errors = {}
+    if missing:
+        fresh, errors = run_queries_parallel(missing, timeout=REPORT_TIMEOUT)
+        with _cache_lock:
+            # Прострочені записи прибираємо при записі, інакше кожен обраний період лишався б у пам'яті назавжди
+            for key in [key for key, (ts, _) in _cache.items() if now - ts >= REPORT_CACHE_TTL]:
+                del _cache[key]
+            for name, df in fresh.items():
+                if name not in errors:
+                    _cache[(name, start, end)] = (now, df)
+        results.update(fresh)
+
+    # Копії, щоб сторінка не змінювала спільний кеш (напр. df_fin['Net Income'] = ...)
+    return {name: (df.copy() if df is not None else None) for name, df in results.items()}, errors
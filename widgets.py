@@ -0,0 +1,63 @@
+# widgets.py
+# Перевикористовувані віджети Streamlit.
+import streamlit as st
+from db_utils import run_query
+from catalog import like_prefix
+
+# Скільки підказок показуємо у випадаючому списку
+SUGGEST_LIMIT = 20
+
+
+@st.cache_data(ttl=60)
+def search_users(prefix, limit=SUGGEST_LIMIT):
+    """Топ користувачів, email яких починається з prefix (індекс idx_users_email_prefix)."""
+    return run_query("""
+        SELECT user_id, email
+        FROM public."Users"
+        WHERE lower(email) LIKE %s
+        ORDER BY lower(email)
+        LIMIT %s;
+    """, (like_prefix(prefix.lower()), limit), fetch="all")
+
+
+@st.cache_data(ttl=60)
+def search_cars(prefix, verified_only=True, limit=SUGGEST_LIMIT):
+    """Топ авто, VIN яких починається з prefix (індекс idx_cars_vin_prefix)."""
+    query = """
+        SELECT c.car_id, c.vin_code || ' | ' || b.name || ' ' || m.name || ' (' || c.year || ')' AS label
+        FROM public."Cars" c
+        JOIN public."Models" m ON c.model_id = m.model_id
+        JOIN public."Brands" b ON m.brand_id = b.brand_id
+        WHERE upper(c.vin_code) LIKE %s
+    """
+    if verified_only:
+        query += " AND c.verification_status = 'verified'"
+    query += " ORDER BY upper(c.vin_code) LIMIT %s;"
+    return run_query(query, (like_prefix(prefix.upper()), limit), fetch="all")
+
+
+def _selector(label, key, matches, id_col, label_col, placeholder):
+    text = st.text_input(f"🔍 {label}", key=f"{key}_q", placeholder=placeholder)
+    matches = matches(text.strip())
+
+    if matches is None or matches.empty:
+        st.caption("Нічого не знайдено.")
+        return None
+
+    # Python int, а не numpy.int64: результат іде прямо в параметри psycopg2
+    labels = dict(zip((int(x) for x in matches[id_col]), matches[label_col]))
+    return st.selectbox(label, options=list(labels), format_func=labels.get, key=key)
+
+
+def user_selector(label, key):
+    """
+    Пошуковий вибір користувача: поле для початку email + список топ-збігів з БД.
+    Повертає user_id або None. Не можна розміщувати всередині st.form (пошук має перезапускати сторінку).
+    """
+    return _selector(label, key, search_users, 'user_id', 'email', "Почніть вводити email...")
+
+
+def car_selector(label, key, verified_only=True):
+    """Пошуковий вибір авто за початком VIN. Повертає car_id або None."""
+    return _selector(label, key, lambda text: search_cars(text, verified_only), 'car_id', 'label',
+                     "Почніть вводити VIN...")